@@ -0,0 +1,85 @@
+"""JSON responses with optional compression for large payloads."""
+
+import gzip
+import os
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from core.serialization import dump_model
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+
+# Bodies smaller than this aren't worth compressing
+COMPRESSION_MIN_BYTES = 1024
+
+
+def compression_enabled() -> bool:
+    """Whether large responses are compressed (RESPONSE_COMPRESSION=on)."""
+    return os.getenv("RESPONSE_COMPRESSION", "on").lower() in ("on", "1", "true")
+
+
+def compress(body: bytes, accept_encoding: str) -> tuple[bytes, str | None]:
+    """
+    Compress a body with the best encoding the client accepts.
+
+    Prefers brotli when the brotli package is installed, then gzip.
+
+    Returns:
+        The (possibly unchanged) body and its Content-Encoding, if any
+    """
+    if not compression_enabled() or len(body) < COMPRESSION_MIN_BYTES:
+        return body, None
+    accepted = _accepted_encodings(accept_encoding)
+    if "br" in accepted and brotli is not None:
+        return brotli.compress(body, quality=4), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    """
+    The encodings an Accept-Encoding header allows.
+
+    Encodings with q=0 (or an unreadable q-value) are refused; ``*``
+    stands for any encoding the header doesn't name.
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.lower()] = weight
+    accepted = {name for name, weight in weights.items() if weight > 0}
+    if "*" in accepted:
+        accepted |= {name for name in ("br", "gzip") if name not in weights}
+    return accepted
+
+
+def model_response(
+    request: Request,
+    model: BaseModel,
+    exclude: set[str] | None = None,
+) -> Response:
+    """Serialize a model to a JSON response, compressed if the client allows."""
+    body, encoding = compress(
+        dump_model(model, exclude=exclude),
+        request.headers.get("accept-encoding", ""),
+    )
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
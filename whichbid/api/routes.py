@@ -1,43 +1,56 @@
 """FastAPI route definitions."""
 
+import asyncio
 import json
-from typing import Annotated
+import os
+import queue
+import time
+import uuid
+from pathlib import Path
+from typing import Annotated, Any, AsyncIterator, Callable
 
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, File, Form, HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
-from core.models import ComparisonCriteria, QuoteAnalysis
-from core.pipeline import run_from_bytes
+from api.responses import model_response
+from core.deadline import Cancelled, Deadline, DeadlineExceeded, deadline_scope
+from core.ingest import SUPPORTED_EXTENSIONS
+from core.models import ComparisonCriteria, CriteriaGrid, QuoteAnalysis, SweepResult
+from core.pipeline import run_from_bytes, sweep_from_bytes
+from core.serialization import dumps, loads
+from core.tracing import span, trace_to
 
 router = APIRouter()
 
+# How often a running request checks whether its client went away
+DISCONNECT_POLL_SECONDS = 0.25
 
-@router.post("/quotes/analyze", response_model=QuoteAnalysis)
-async def analyze_quotes(
-    files: Annotated[list[UploadFile], File(description="PDF quote files to analyze")],
-    criteria: Annotated[str | None, Form(description="JSON string of ComparisonCriteria")] = None,
-) -> QuoteAnalysis:
-    """
-    Analyze and compare vendor quotes.
+# Status for a request whose client disconnected (nginx convention)
+CLIENT_CLOSED_REQUEST = 499
 
-    Accepts multiple PDF files and optional comparison criteria.
-    Returns a comprehensive analysis with rankings and recommendations.
-    """
+
+async def _read_request(
+    files: list[UploadFile],
+    criteria: str | None,
+) -> tuple[list[bytes], list[str], ComparisonCriteria | None]:
+    """Validate uploaded files and criteria, returning file bytes, names and criteria."""
     if not files:
-        raise HTTPException(status_code=400, detail="At least one PDF file is required")
+        raise HTTPException(status_code=400, detail="At least one quote file is required")
 
     # Validate file types
     for f in files:
-        if not f.filename or not f.filename.lower().endswith(".pdf"):
+        if not f.filename or not f.filename.lower().endswith(SUPPORTED_EXTENSIONS):
             raise HTTPException(
                 status_code=400,
-                detail=f"File '{f.filename}' is not a PDF"
+                detail=f"File '{f.filename}' is not a supported type ({', '.join(SUPPORTED_EXTENSIONS)})"
             )
 
     # Parse criteria if provided
     parsed_criteria: ComparisonCriteria | None = None
     if criteria:
         try:
-            criteria_data = json.loads(criteria)
+            criteria_data = loads(criteria)
             parsed_criteria = ComparisonCriteria.model_validate(criteria_data)
         except json.JSONDecodeError as e:
             raise HTTPException(
@@ -50,7 +63,7 @@ async def analyze_quotes(
                 detail=f"Invalid criteria format: {e}"
             )
 
-    # Read all PDF bytes
+    # Read all file bytes
     try:
         pdf_bytes_list = [await f.read() for f in files]
     except Exception as e:
@@ -59,10 +72,113 @@ async def analyze_quotes(
             detail=f"Failed to read uploaded files: {e}"
         )
 
+    return pdf_bytes_list, [f.filename for f in files], parsed_criteria
+
+
+def _trace_path(request: Request) -> Path | None:
+    """
+    Where to write a trace of this request, if it asked for one.
+
+    Requests sending ``X-Trace: 1`` are traced when TRACE_DIR is set; the
+    file name is returned to the client in the ``X-Trace-File`` header.
+    """
+    directory = os.getenv("TRACE_DIR")
+    if not directory or request.headers.get("x-trace") != "1":
+        return None
+    name = f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.json"
+    return Path(directory) / name
+
+
+def _request_deadline(request: Request) -> Deadline:
+    """
+    The deadline for this request.
+
+    The client may set one with an ``X-Request-Timeout`` header (seconds);
+    REQUEST_TIMEOUT caps it server-side. Without either the request can
+    still be cancelled when the client disconnects.
+    """
+    limits: list[float] = []
+    server_limit = float(os.getenv("REQUEST_TIMEOUT", "0"))
+    if server_limit > 0:
+        limits.append(server_limit)
+    header = request.headers.get("x-request-timeout")
+    if header:
+        try:
+            client_limit = float(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="X-Request-Timeout must be a number of seconds")
+        if client_limit <= 0:
+            raise HTTPException(status_code=400, detail="X-Request-Timeout must be positive")
+        limits.append(client_limit)
+    return Deadline(min(limits) if limits else None)
+
+
+async def _run_pipeline(
+    request: Request,
+    trace_path: Path | None,
+    func: Callable[..., Any],
+    *args: Any,
+    **kwargs: Any,
+) -> Any:
+    """
+    Run a pipeline call in a worker thread under the request's deadline.
+
+    The event loop stays free meanwhile; if the client disconnects the
+    run is cancelled, which closes its outstanding LLM streams.
+
+    Raises:
+        HTTPException: 504 when the deadline passes, 499 when the client
+            went away
+    """
+    deadline = _request_deadline(request)
+
+    def work() -> Any:
+        with deadline_scope(deadline), trace_to(trace_path), span("request", path=request.url.path):
+            return func(*args, **kwargs)
+
+    task = asyncio.ensure_future(run_in_threadpool(work))
+    while not task.done():
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if not task.done() and not deadline.cancelled and await request.is_disconnected():
+            deadline.cancel("client disconnected")
+    try:
+        return task.result()
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Cancelled as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+
+
+@router.post("/quotes/analyze", response_model=QuoteAnalysis)
+async def analyze_quotes(
+    request: Request,
+    files: Annotated[list[UploadFile], File(description="Quote files to analyze (PDF, CSV, XLSX or TXT)")],
+    criteria: Annotated[str | None, Form(description="JSON string of ComparisonCriteria")] = None,
+    drop_terms: Annotated[bool, Form(description="Drop terms-and-conditions sections before parsing")] = False,
+    include_quotes: Annotated[bool, Form(description="Echo the parsed quotes back in the response")] = True,
+) -> Response:
+    """
+    Analyze and compare vendor quotes.
+
+    Accepts multiple quote files (PDF, CSV, XLSX or TXT) and optional
+    comparison criteria.
+    Returns a comprehensive analysis with rankings and recommendations.
+    Large responses are compressed when the client accepts gzip or brotli;
+    set include_quotes=false to leave out the parsed quotes echo.
+    Send ``X-Trace: 1`` to record a trace of the request (see TRACE_DIR)
+    and ``X-Request-Timeout`` to bound it (see _request_deadline).
+    """
+    pdf_bytes_list, filenames, parsed_criteria = await _read_request(files, criteria)
+    trace_path = _trace_path(request)
+
     # Run the pipeline
     try:
-        analysis = run_from_bytes(pdf_bytes_list, parsed_criteria)
-        return analysis
+        analysis = await _run_pipeline(
+            request, trace_path, run_from_bytes,
+            pdf_bytes_list, parsed_criteria, drop_terms=drop_terms, filenames=filenames,
+        )
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -71,6 +187,130 @@ async def analyze_quotes(
             detail=f"Analysis failed: {e}"
         )
 
+    exclude = None if include_quotes else {"quotes"}
+    response = model_response(request, analysis, exclude=exclude)
+    if trace_path is not None:
+        response.headers["X-Trace-File"] = trace_path.name
+    return response
+
+
+@router.post("/quotes/analyze/stream")
+async def analyze_quotes_stream(
+    request: Request,
+    files: Annotated[list[UploadFile], File(description="Quote files to analyze (PDF, CSV, XLSX or TXT)")],
+    criteria: Annotated[str | None, Form(description="JSON string of ComparisonCriteria")] = None,
+    drop_terms: Annotated[bool, Form(description="Drop terms-and-conditions sections before parsing")] = False,
+) -> StreamingResponse:
+    """
+    Analyze and compare vendor quotes, streaming partial results.
+
+    Returns newline-delimited JSON events. Each line is
+    {"event": kind, "data": ...} where kind is one of "preprocess",
+    "template", "revision", "line_item", "model", "hidden_cost",
+    "ranked_quote", "recommendation", then a final "analysis" event with the full
+    QuoteAnalysis, or an "error" event.
+    Send ``X-Trace: 1`` to record a trace of the request (see TRACE_DIR)
+    and ``X-Request-Timeout`` to bound it. The run is cancelled if the
+    client disconnects.
+    """
+    pdf_bytes_list, filenames, parsed_criteria = await _read_request(files, criteria)
+    trace_path = _trace_path(request)
+    deadline = _request_deadline(request)
+
+    events: queue.Queue[dict | None] = queue.Queue()
+
+    def on_partial(kind: str, value) -> None:
+        data = value.model_dump() if hasattr(value, "model_dump") else value
+        events.put({"event": kind, "data": data})
+
+    def worker() -> None:
+        try:
+            with deadline_scope(deadline), trace_to(trace_path), span("request", path=request.url.path):
+                analysis = run_from_bytes(
+                    pdf_bytes_list, parsed_criteria, on_partial, drop_terms, filenames
+                )
+            events.put({"event": "analysis", "data": analysis.model_dump(mode="json")})
+        except Exception as e:
+            events.put({"event": "error", "data": str(e)})
+        finally:
+            events.put(None)
+
+    async def stream() -> AsyncIterator[str]:
+        # The worker shares the threadpool's limiter with every other
+        # request instead of starting a thread of its own
+        worker_task = asyncio.ensure_future(run_in_threadpool(worker))
+        try:
+            while True:
+                try:
+                    event = events.get_nowait()
+                except queue.Empty:
+                    if await request.is_disconnected():
+                        return
+                    await asyncio.sleep(0.05)
+                    continue
+                if event is None:
+                    await worker_task
+                    return
+                yield dumps(event) + "\n"
+        finally:
+            # Stop the worker if the client went away before the end
+            deadline.cancel("client disconnected")
+
+    headers = {"X-Trace-File": trace_path.name} if trace_path is not None else None
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers=headers)
+
+
+@router.post("/quotes/sweep", response_model=SweepResult)
+async def sweep_criteria(
+    request: Request,
+    files: Annotated[list[UploadFile], File(description="Quote files to analyze (PDF, CSV, XLSX or TXT)")],
+    criteria: Annotated[str | None, Form(description="JSON string of the base ComparisonCriteria")] = None,
+    grid: Annotated[str | None, Form(description="JSON string of a CriteriaGrid of variants to try")] = None,
+    explain: Annotated[str | None, Form(description="Comma-separated variant indexes to run the full LLM analysis for")] = None,
+    drop_terms: Annotated[bool, Form(description="Drop terms-and-conditions sections before parsing")] = False,
+) -> Response:
+    """
+    Score quotes under many criteria variants in one pass.
+
+    Quotes are parsed once and scored locally under every variant of the
+    grid (variant 0 is the base criteria). The response reports each
+    variant's ranking, how stable the winner and ranking are, and the
+    variants where the winner flips. The full LLM analysis runs only for
+    the variants listed in explain.
+    """
+    pdf_bytes_list, filenames, parsed_criteria = await _read_request(files, criteria)
+    trace_path = _trace_path(request)
+
+    try:
+        parsed_grid = CriteriaGrid.model_validate(loads(grid)) if grid else None
+        explain_indexes = [int(e) for e in explain.split(",") if e.strip()] if explain else None
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sweep grid: {e}"
+        )
+
+    try:
+        result = await _run_pipeline(
+            request, trace_path, sweep_from_bytes,
+            pdf_bytes_list, parsed_criteria, parsed_grid, explain_indexes,
+            drop_terms=drop_terms, filenames=filenames,
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Sweep failed: {e}"
+        )
+
+    response = model_response(request, result)
+    if trace_path is not None:
+        response.headers["X-Trace-File"] = trace_path.name
+    return response
+
 
 @router.get("/health")
 async def health_check() -> dict:
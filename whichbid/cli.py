@@ -9,8 +9,12 @@ from rich.console import Console
 from rich.prompt import Prompt, Confirm
 from rich.table import Table
 
-from core.models import ComparisonCriteria
-from core.pipeline import run
+from core.deadline import Cancelled, Deadline, deadline_scope
+from core.ingest import SUPPORTED_EXTENSIONS
+from core.models import ComparisonCriteria, CriteriaGrid
+from core.pipeline import run, sweep as run_sweep
+from core.serialization import dump_model
+from core.tracing import sample_to, span, trace_to
 
 # Load environment variables
 load_dotenv()
@@ -45,6 +49,30 @@ def parse_must_include(must_include: str | None) -> list[str] | None:
     return [m.strip() for m in must_include.split(",")]
 
 
+def parse_budgets(budgets: str | None, base: float | None) -> list[float | None] | None:
+    """
+    Parse comma-separated budget alternatives.
+
+    Entries are amounts, "none" for no limit, or signed percentages of the
+    base budget (e.g. '-10%,+10%').
+    """
+    if not budgets:
+        return None
+    values: list[float | None] = []
+    for entry in (b.strip() for b in budgets.split(",")):
+        if not entry:
+            continue
+        if entry.lower() == "none":
+            values.append(None)
+        elif entry.endswith("%"):
+            if base is None:
+                raise typer.BadParameter("percentage budgets need a base --budget", param_hint="--budgets")
+            values.append(round(base * (1 + float(entry[:-1]) / 100), 2))
+        else:
+            values.append(float(entry.lstrip("$")))
+    return values
+
+
 def prompt_for_criteria() -> ComparisonCriteria:
     """Interactively prompt user for comparison criteria."""
     console.print("\n[bold cyan]Configure Comparison Criteria[/bold cyan]")
@@ -88,6 +116,41 @@ def prompt_for_criteria() -> ComparisonCriteria:
     )
 
 
+def print_partial(kind: str, value) -> None:
+    """Print a partial result as soon as the LLM finishes streaming it."""
+    if kind == "preprocess":
+        console.print(
+            f"[dim]  preprocessed: {value.original_tokens:,} -> {value.tokens:,} tokens "
+            f"(-{value.reduction:.0%})[/dim]"
+        )
+    elif kind == "template":
+        console.print(f"[dim]  parsed {value} from learned template (no LLM call)[/dim]")
+    elif kind == "revision":
+        pages = ", ".join(str(n) for n in value.changed_pages) or "none"
+        console.print(
+            f"[dim]  {value.vendor_name}: revision of an earlier quote, changed pages: {pages}; "
+            f"+{len(value.added_items)}/-{len(value.removed_items)} items, "
+            f"total ${value.previous_total:,.2f} -> ${value.total:,.2f}[/dim]"
+        )
+    elif kind == "line_item":
+        console.print(f"[dim]  item: {value.description} (${value.total:,.2f})[/dim]")
+    elif kind == "hidden_cost":
+        console.print(f"[dim]  hidden cost: {value.vendor} - {value.item}[/dim]")
+    elif kind == "ranked_quote":
+        console.print(f"[dim]  ranked: {value.vendor} scored {value.score:.0f}[/dim]")
+    elif kind == "recommendation":
+        console.print("[dim]  recommendation ready[/dim]")
+    elif kind == "model":
+        subject = f" of {value.subject}" if value.subject else ""
+        if value.escalated_from:
+            console.print(
+                f"[yellow]  escalated {value.stage}{subject} from {value.escalated_from} "
+                f"to {value.model}: {value.reason}[/yellow]"
+            )
+        else:
+            console.print(f"[dim]  {value.stage}{subject} served by {value.model}[/dim]")
+
+
 def print_table(analysis) -> None:
     """Print analysis results as a rich table."""
     # Ranking table
@@ -144,17 +207,93 @@ def print_table(analysis) -> None:
 
     # Confidence and caveats
     console.print(f"[bold]Confidence:[/bold] {analysis.confidence:.0%}")
+    if analysis.models_used:
+        served: dict[str, list[str]] = {}
+        for used in analysis.models_used:
+            served.setdefault(used.stage, []).append(used.model)
+        console.print("[bold]Models:[/bold] " + "; ".join(
+            f"{stage}: " + ", ".join(f"{m} x{models.count(m)}" for m in dict.fromkeys(models))
+            for stage, models in served.items()
+        ))
+        escalated = sum(1 for used in analysis.models_used if used.escalated_from)
+        if escalated:
+            console.print(f"  ({escalated} stage(s) escalated to a stronger model)")
     if analysis.caveats:
         console.print("[bold]Caveats:[/bold]")
         for caveat in analysis.caveats:
             console.print(f"  - {caveat}")
 
 
+def print_sweep(result) -> None:
+    """Print sweep results as rich tables."""
+    table = Table(title="Criteria Variants")
+    table.add_column("#", style="cyan", justify="right")
+    table.add_column("Priorities")
+    table.add_column("Budget", justify="right")
+    table.add_column("Must Include")
+    table.add_column("Winner", style="green")
+    table.add_column("Runner-up")
+    table.add_column("Agreement", justify="right", style="yellow")
+
+    base_winner = result.variants[0].winner
+    for v in result.variants:
+        c = v.criteria
+        winner = f"{v.winner} ({v.scores[v.winner]:.0f})"
+        if v.winner != base_winner:
+            winner = f"[bold red]{winner}[/bold red]"
+        runner_up = v.ranking[1] if len(v.ranking) > 1 else None
+        table.add_row(
+            str(v.index),
+            ", ".join(c.priorities),
+            f"${c.budget_limit:,.0f}" if c.budget_limit is not None else "-",
+            ", ".join(c.must_include or []) or "-",
+            winner,
+            f"{runner_up} ({v.scores[runner_up]:.0f})" if runner_up else "-",
+            f"{v.rank_agreement:+.2f}",
+        )
+    console.print(table)
+    console.print()
+
+    stability = Table(title="Vendor Stability")
+    stability.add_column("Vendor", style="green")
+    stability.add_column("Wins", justify="right")
+    stability.add_column("Rank Range", justify="right")
+    stability.add_column("Mean Score", justify="right", style="yellow")
+    for s in result.vendor_stability:
+        stability.add_row(
+            s.vendor,
+            f"{s.wins}/{len(result.variants)}",
+            f"{s.best_rank}-{s.worst_rank}",
+            f"{s.mean_score:.1f}",
+        )
+    console.print(stability)
+    console.print()
+
+    console.print(
+        f"[bold]Winner stability:[/bold] {result.stability:.0%} of variants pick {base_winner}; "
+        f"mean rank agreement {result.rank_agreement:+.2f}"
+    )
+    if result.flips:
+        console.print("[bold]Winner flips:[/bold]")
+        for flip in result.flips:
+            console.print(f"  #{flip.variant}: {flip.winner} ({'; '.join(flip.changes)})")
+    if result.unscored_priorities:
+        console.print(
+            f"[dim]Not scored locally: {', '.join(result.unscored_priorities)} "
+            f"(use --explain for an LLM analysis that weighs them)[/dim]"
+        )
+
+    for index, analysis in result.analyses.items():
+        console.print()
+        console.print(f"[bold cyan]Analysis for variant #{index}[/bold cyan]")
+        print_table(analysis)
+
+
 @app.command()
 def analyze(
     files: list[Path] = typer.Argument(
         ...,
-        help="PDF quote files to analyze",
+        help="Quote files to analyze (PDF, CSV, XLSX or TXT)",
         exists=True,
         readable=True,
     ),
@@ -183,17 +322,47 @@ def analyze(
         "--notes", "-n",
         help="Additional context for the analysis",
     ),
+    drop_terms: bool = typer.Option(
+        False,
+        "--drop-terms",
+        help="Drop long terms-and-conditions sections before parsing",
+    ),
     output_format: str = typer.Option(
         "table",
         "--format", "-f",
         help="Output format: 'table' or 'json'",
     ),
+    include_quotes: bool = typer.Option(
+        True,
+        "--quotes/--no-quotes",
+        help="Include the parsed quotes in JSON output",
+    ),
+    profile: Path = typer.Option(
+        None,
+        "--profile",
+        help="Write a Chrome/Perfetto trace of the run to this file",
+        dir_okay=False,
+    ),
+    profile_samples: bool = typer.Option(
+        False,
+        "--profile-samples",
+        help="With --profile, also write sampled Python stacks (folded format) next to the trace",
+    ),
+    timeout: float = typer.Option(
+        None,
+        "--timeout", "-t",
+        help="Give up after this many seconds, cancelling outstanding LLM requests",
+        min=0.1,
+    ),
 ) -> None:
     """Analyze and compare vendor quotes."""
-    # Validate files are PDFs
+    # Validate file types
     for f in files:
-        if not f.suffix.lower() == ".pdf":
-            console.print(f"[red]Error: {f} is not a PDF file[/red]")
+        if f.suffix.lower() not in SUPPORTED_EXTENSIONS:
+            console.print(
+                f"[red]Error: {f} is not a supported file "
+                f"({', '.join(SUPPORTED_EXTENSIONS)})[/red]"
+            )
             raise typer.Exit(1)
 
     # Build criteria - interactive or from options
@@ -208,16 +377,141 @@ def analyze(
         )
 
     console.print(f"[bold]Analyzing {len(files)} quote(s)...[/bold]")
+    samples = profile.with_suffix(".folded") if profile and profile_samples else None
 
     try:
-        analysis = run([str(f) for f in files], criteria)
+        # Partial output would corrupt JSON on stdout, so only show it for tables
+        on_partial = print_partial if output_format != "json" else None
+        with deadline_scope(Deadline(timeout) if timeout else None):
+            with trace_to(profile), sample_to(samples), span("run", files=len(files)):
+                analysis = run([str(f) for f in files], criteria, on_partial, drop_terms)
 
         if output_format == "json":
-            console.print(analysis.model_dump_json(indent=2))
+            # Written directly: rich's highlighting is slow on large JSON
+            exclude = None if include_quotes else {"quotes"}
+            typer.echo(dump_model(analysis, indent=True, exclude=exclude).decode())
         else:
             print_table(analysis)
 
+    except (ValueError, Cancelled) as e:
+        console.print(f"[red]Error: {e}[/red]")
+        raise typer.Exit(1)
+    except Exception as e:
+        console.print(f"[red]Unexpected error: {e}[/red]")
+        raise typer.Exit(1)
+    finally:
+        if profile:
+            console.print(f"[dim]Trace written to {profile}[/dim]")
+        if samples:
+            console.print(f"[dim]Stack samples written to {samples}[/dim]")
+
+
+@app.command()
+def sweep(
+    files: list[Path] = typer.Argument(
+        ...,
+        help="Quote files to analyze (PDF, CSV, XLSX or TXT)",
+        exists=True,
+        readable=True,
+    ),
+    priorities: str = typer.Option(
+        None,
+        "--priorities", "-p",
+        help="Base comma-separated priorities in order of importance",
+    ),
+    must_include: str = typer.Option(
+        None,
+        "--must-include", "-m",
+        help="Base comma-separated required items",
+    ),
+    budget: float = typer.Option(
+        None,
+        "--budget", "-b",
+        help="Base maximum acceptable budget",
+    ),
+    notes: str = typer.Option(
+        None,
+        "--notes", "-n",
+        help="Additional context for explained variants",
+    ),
+    orders: list[str] = typer.Option(
+        None,
+        "--order", "-o",
+        help="Alternative priority order to try (repeatable, e.g. -o 'timeline,price')",
+    ),
+    permute: bool = typer.Option(
+        False,
+        "--permute",
+        help="Try every ordering of the base priorities",
+    ),
+    budgets: str = typer.Option(
+        None,
+        "--budgets",
+        help="Alternative budgets: amounts, 'none', or percentages of --budget (e.g. '-10%,+10%')",
+    ),
+    explain: str = typer.Option(
+        None,
+        "--explain", "-e",
+        help="Comma-separated variant numbers to run the full LLM analysis for",
+    ),
+    drop_terms: bool = typer.Option(
+        False,
+        "--drop-terms",
+        help="Drop long terms-and-conditions sections before parsing",
+    ),
+    output_format: str = typer.Option(
+        "table",
+        "--format", "-f",
+        help="Output format: 'table' or 'json'",
+    ),
+    timeout: float = typer.Option(
+        None,
+        "--timeout", "-t",
+        help="Give up after this many seconds, cancelling outstanding LLM requests",
+        min=0.1,
+    ),
+) -> None:
+    """Score quotes under many criteria variants and show where the winner changes."""
+    for f in files:
+        if f.suffix.lower() not in SUPPORTED_EXTENSIONS:
+            console.print(
+                f"[red]Error: {f} is not a supported file "
+                f"({', '.join(SUPPORTED_EXTENSIONS)})[/red]"
+            )
+            raise typer.Exit(1)
+
+    criteria = ComparisonCriteria(
+        priorities=parse_priorities(priorities),
+        must_include=parse_must_include(must_include),
+        budget_limit=budget,
+        notes=notes,
+    )
+    try:
+        grid = CriteriaGrid(
+            priorities=[parse_priorities(o) for o in orders] if orders else None,
+            permute_priorities=permute,
+            budget_limit=parse_budgets(budgets, budget),
+        )
+        explain_indexes = [int(e) for e in explain.split(",") if e.strip()] if explain else None
     except ValueError as e:
+        console.print(f"[red]Error: invalid sweep option: {e}[/red]")
+        raise typer.Exit(1)
+
+    console.print(f"[bold]Sweeping criteria over {len(files)} quote(s)...[/bold]")
+
+    try:
+        on_partial = print_partial if output_format != "json" else None
+        with deadline_scope(Deadline(timeout) if timeout else None):
+            result = run_sweep(
+                [str(f) for f in files], criteria, grid, explain_indexes, on_partial, drop_terms
+            )
+
+        if output_format == "json":
+            typer.echo(dump_model(result, indent=True).decode())
+        else:
+            print_sweep(result)
+
+    except (ValueError, Cancelled) as e:
         console.print(f"[red]Error: {e}[/red]")
         raise typer.Exit(1)
     except Exception as e:
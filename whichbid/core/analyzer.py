@@ -1,9 +1,29 @@
 """LLM-based quote analysis: compare, detect hidden costs, score, recommend."""
 
-import json
-
-from core.llm import get_client, get_model
-from core.models import ComparisonCriteria, ParsedQuote, QuoteAnalysis
+from contextlib import closing
+from typing import Any
+
+from pydantic import ValidationError
+
+from core.deadline import Cancelled
+from core.llm import get_escalation_model, get_min_confidence, get_stage_model, stream_chat
+from core.models import (
+    ComparisonCriteria,
+    HiddenCost,
+    ParsedQuote,
+    QuoteAnalysis,
+    RankedQuote,
+    StageModel,
+)
+from core.repair import (
+    coerce_analysis,
+    coerce_hidden_cost,
+    coerce_ranked_quote,
+    retry_invalid_fields,
+)
+from core.serialization import dumps, schema_json
+from core.streaming import IncrementalJSONParser, MalformedJSONError, PartialCallback
+from core.tracing import span
 
 
 ANALYZE_PROMPT = """You are a quote analysis expert. Compare the following vendor quotes and provide a comprehensive analysis.
@@ -55,16 +75,36 @@ Analyze these quotes and return a JSON object matching this schema:
 Return only valid JSON."""
 
 
+# Filled in by the pipeline, so left out of the schema the LLM is given
+PIPELINE_FIELDS = ("models_used",)
+
+# Top-level fields surfaced to the caller while the analysis is streaming
+PARTIAL_FIELDS = {
+    "hidden_costs": ("hidden_cost", HiddenCost, coerce_hidden_cost),
+    "ranking": ("ranked_quote", RankedQuote, coerce_ranked_quote),
+}
+
+
 def analyze_quotes(
     quotes: list[ParsedQuote],
-    criteria: ComparisonCriteria | None = None
+    criteria: ComparisonCriteria | None = None,
+    on_partial: PartialCallback | None = None,
 ) -> QuoteAnalysis:
     """
     Analyze and compare parsed quotes.
 
+    Runs on the analyze-stage model, and again on the escalation model
+    (when different) if the answer was cut off, malformed or fails
+    validation, or reports a confidence below MIN_CONFIDENCE. Partial
+    results of an attempt that may still escalate are held back until it
+    is accepted, so callers never see two sets of them.
+
     Args:
         quotes: List of parsed quotes to compare
         criteria: User-defined comparison criteria (uses defaults if None)
+        on_partial: Optional callback receiving ("hidden_cost", HiddenCost),
+            ("ranked_quote", RankedQuote) and ("recommendation", str) as
+            each one finishes streaming, and ("model", StageModel) at the end
 
     Returns:
         QuoteAnalysis with rankings, hidden costs, and recommendation
@@ -78,40 +118,138 @@ def analyze_quotes(
     if criteria is None:
         criteria = ComparisonCriteria()
 
-    client = get_client()
-    model = get_model()
+    with span("build prompt", prompt="analyze", quotes=len(quotes)):
+        quotes_json = [q.model_dump() for q in quotes]
+        quotes_text = dumps(quotes_json, indent=True)
 
-    quotes_json = [q.model_dump() for q in quotes]
-    schema = QuoteAnalysis.model_json_schema()
+        prompt = ANALYZE_PROMPT.format(
+            criteria=criteria.model_dump_json(indent=2),
+            quotes=quotes_text,
+            schema=schema_json(QuoteAnalysis, exclude=PIPELINE_FIELDS)
+        )
 
-    prompt = ANALYZE_PROMPT.format(
-        criteria=criteria.model_dump_json(indent=2),
-        quotes=json.dumps(quotes_json, indent=2),
-        schema=json.dumps(schema, indent=2)
-    )
+    model = get_stage_model("analyze")
+    escalation = get_escalation_model()
 
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-            response_format={"type": "json_object"},
+    def attempt(
+        llm_model: str, callback: PartialCallback | None, repair: bool
+    ) -> tuple[QuoteAnalysis | None, str | None]:
+        return _analyze_with(
+            llm_model, prompt, criteria, quotes_json, quotes_text, callback, repair
         )
 
-        content = response.choices[0].message.content
-        if not content:
-            raise ValueError("LLM returned empty response")
+    try:
+        if escalation == model:
+            analysis, _ = attempt(model, on_partial, repair=True)
+            used = StageModel(stage="analyze", model=model)
+        else:
+            held: list[tuple[str, Any]] = []
+            analysis, reason = attempt(
+                model, lambda kind, value: held.append((kind, value)), repair=False
+            )
+            if reason is None:
+                if on_partial is not None:
+                    for kind, value in held:
+                        on_partial(kind, value)
+                used = StageModel(stage="analyze", model=model)
+            else:
+                analysis, _ = attempt(escalation, on_partial, repair=True)
+                used = StageModel(
+                    stage="analyze", model=escalation, escalated_from=model, reason=reason
+                )
+        analysis.models_used = [used]
+        if on_partial is not None:
+            on_partial("model", used)
+        return analysis
+
+    except Cancelled:
+        raise
+    except Exception as e:
+        raise ValueError(f"Quote analysis failed: {e}") from e
 
-        data = json.loads(content)
 
-        # Ensure criteria_used reflects what we actually used
-        data["criteria_used"] = criteria.model_dump()
-        # Include the original parsed quotes
-        data["quotes"] = quotes_json
+def _analyze_with(
+    model: str,
+    prompt: str,
+    criteria: ComparisonCriteria,
+    quotes_json: list[dict],
+    quotes_text: str,
+    on_partial: PartialCallback | None,
+    repair: bool,
+) -> tuple[QuoteAnalysis | None, str | None]:
+    """
+    One analysis attempt with one model.
 
-        return QuoteAnalysis.model_validate(data)
+    With ``repair`` off, a cut-off, malformed or invalid answer is a
+    reason to escalate and is not repaired.
 
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Failed to parse LLM response as JSON: {e}") from e
-    except Exception as e:
-        raise ValueError(f"Quote analysis failed: {e}") from e
+    Returns:
+        The analysis (None when escalating without one) and the reason
+        to escalate, if any
+    """
+    def emit(path, value) -> None:
+        if on_partial is None:
+            return
+        if path == ("recommendation",):
+            if isinstance(value, str):
+                on_partial("recommendation", value)
+            return
+        kind, schema, coerce = PARTIAL_FIELDS[path[0]]
+        try:
+            on_partial(kind, schema.model_validate(coerce(value)))
+        except ValidationError:
+            # Invalid items are repaired (or retried) once the stream ends
+            pass
+
+    decoder = IncrementalJSONParser(
+        watch={("hidden_costs", "*"), ("ranking", "*"), ("recommendation",)},
+        on_value=emit,
+    )
+
+    aborted = False
+    try:
+        with closing(stream_chat(prompt, model)) as chunks:
+            decoder.feed_all(chunks)
+    except MalformedJSONError:
+        # Stop paying for a broken generation; salvage what arrived
+        aborted = True
+
+    if not repair:
+        if aborted:
+            return None, "malformed response"
+        if not decoder.complete:
+            return None, "response was cut off"
+
+    try:
+        with span("json decode", chars=len(decoder.text)):
+            data = coerce_analysis(decoder.close())
+        if not isinstance(data, dict):
+            raise ValueError("LLM response was not a JSON object")
+    except ValueError as e:
+        if not repair:
+            return None, f"unreadable response ({e})"
+        raise
+
+    # Ensure criteria_used reflects what we actually used
+    data["criteria_used"] = criteria.model_dump()
+    # Include the original parsed quotes
+    data["quotes"] = quotes_json
+    # Filled in by the caller
+    data["models_used"] = []
+
+    try:
+        with span("validate", model="QuoteAnalysis"):
+            analysis = QuoteAnalysis.model_validate(data)
+    except ValidationError as e:
+        if not repair:
+            return None, f"invalid response ({e.error_count()} field errors)"
+        # The quotes go in the context, so don't repeat them in the JSON
+        partial = {k: v for k, v in data.items() if k != "quotes"}
+        data = coerce_analysis(retry_invalid_fields(QuoteAnalysis, partial, e, quotes_text, model))
+        data["quotes"] = quotes_json
+        return QuoteAnalysis.model_validate(data), None
+
+    threshold = get_min_confidence()
+    if analysis.confidence < threshold:
+        return analysis, f"confidence {analysis.confidence:.2f} below {threshold:.2f}"
+    return analysis, None
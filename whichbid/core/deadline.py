@@ -0,0 +1,183 @@
+"""Request deadlines and cooperative cancellation.
+
+A Deadline is installed for a run with ``deadline_scope``, like a
+tracer: code deep in the pipeline finds it through a context variable
+instead of having it passed down. Long waits register a callback with
+``on_cancel`` (the LLM client closes its HTTP stream), and loops call
+``check_deadline`` between units of work, so a run stops promptly once
+its deadline passes or its caller goes away.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+
+_current: ContextVar["Deadline | None"] = ContextVar("deadline", default=None)
+
+
+class Cancelled(Exception):
+    """Raised when a run is cancelled before it finished."""
+
+
+class DeadlineExceeded(Cancelled):
+    """Raised when a run outlives its deadline."""
+
+
+class Deadline:
+    """
+    A point in time after which a run should give up, plus a cancel switch.
+
+    ``seconds=None`` means no time limit; the run can still be cancelled
+    explicitly, e.g. when the client disconnects.
+    """
+
+    def __init__(self, seconds: float | None = None) -> None:
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        self.reason: str | None = None
+        self._cancelled = threading.Event()
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the run has been cancelled or has expired."""
+        return self._cancelled.is_set() or self.remaining() == 0
+
+    def remaining(self) -> float | None:
+        """Seconds left, 0 once expired, or None without a time limit."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Cancel the run, interrupting any registered waits."""
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self.reason = reason
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # Interrupting a wait is best effort; the waiter re-checks
+                pass
+
+    def check(self, where: str | None = None) -> None:
+        """
+        Raise if the run has expired or been cancelled.
+
+        Raises:
+            DeadlineExceeded: If the deadline has passed
+            Cancelled: If the run was cancelled for another reason
+        """
+        if self.remaining() == 0 and not self._cancelled.is_set():
+            self.cancel("deadline")
+        if not self._cancelled.is_set():
+            return
+        during = f" during {where}" if where else ""
+        if self.reason == "deadline":
+            raise DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded{during}")
+        raise Cancelled(f"Run cancelled ({self.reason}){during}")
+
+    def wait(self, seconds: float) -> None:
+        """Sleep, waking early (and raising) if the run is cancelled."""
+        remaining = self.remaining()
+        timeout = seconds if remaining is None else min(seconds, remaining)
+        if self._cancelled.wait(timeout) or timeout < seconds:
+            self.check()
+
+    def add_callback(self, callback: Callable[[], None]) -> bool:
+        """Register a cancel callback; returns False if already cancelled."""
+        with self._lock:
+            if self._cancelled.is_set():
+                return False
+            self._callbacks.append(callback)
+            return True
+
+    def remove_callback(self, callback: Callable[[], None]) -> None:
+        """Unregister a cancel callback."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def start(self) -> None:
+        """Fire cancel callbacks when the deadline passes."""
+        remaining = self.remaining()
+        if remaining is not None and self._timer is None:
+            self._timer = threading.Timer(remaining, self.cancel, ["deadline"])
+            self._timer.daemon = True
+            self._timer.start()
+
+    def stop(self) -> None:
+        """Stop the expiry timer."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+def current_deadline() -> Deadline | None:
+    """The deadline active in this context, if any."""
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline | None) -> Iterator[Deadline | None]:
+    """Run the block under a deadline. Does nothing when ``deadline`` is None."""
+    if deadline is None:
+        yield None
+        return
+    token = _current.set(deadline)
+    deadline.start()
+    try:
+        yield deadline
+    finally:
+        deadline.stop()
+        _current.reset(token)
+
+
+def check_deadline(where: str | None = None) -> None:
+    """Raise Cancelled if the active deadline has passed or was cancelled."""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check(where)
+
+
+def remaining_time() -> float | None:
+    """Seconds left on the active deadline, or None without one."""
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def sleep(seconds: float) -> None:
+    """time.sleep that is cut short by cancellation."""
+    deadline = _current.get()
+    if deadline is None:
+        time.sleep(seconds)
+    else:
+        deadline.wait(seconds)
+
+
+@contextmanager
+def on_cancel(callback: Callable[[], None]) -> Iterator[None]:
+    """
+    Call ``callback`` if the active deadline passes or is cancelled while
+    the block runs (from another thread). Runs it immediately if the
+    deadline is already cancelled.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        yield
+        return
+    if not deadline.add_callback(callback):
+        callback()
+    try:
+        yield
+    finally:
+        deadline.remove_callback(callback)
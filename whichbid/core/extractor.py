@@ -6,16 +6,19 @@ from typing import BinaryIO
 
 import pdfplumber
 
+from core.deadline import Cancelled, check_deadline
+from core.tracing import span
 
-def extract_text_from_pdf(pdf_input: str | Path | BinaryIO) -> str:
+
+def extract_pages_from_pdf(pdf_input: str | Path | BinaryIO) -> list[str]:
     """
-    Extract raw text from a PDF file.
+    Extract raw text from a PDF file, one string per page.
 
     Args:
         pdf_input: File path (str or Path) or file-like object with PDF bytes
 
     Returns:
-        Raw text string extracted from all pages
+        Text of each page that has extractable text
 
     Raises:
         ValueError: If the PDF cannot be read or contains no text
@@ -23,21 +26,55 @@ def extract_text_from_pdf(pdf_input: str | Path | BinaryIO) -> str:
     try:
         with pdfplumber.open(pdf_input) as pdf:
             pages_text = []
-            for page in pdf.pages:
-                text = page.extract_text()
+            for number, page in enumerate(pdf.pages, 1):
+                check_deadline("extraction")
+                with span("extract page", "extract", page=number) as args:
+                    text = page.extract_text()
+                    args["chars"] = len(text or "")
                 if text:
                     pages_text.append(text)
 
             if not pages_text:
                 raise ValueError("PDF contains no extractable text")
 
-            return "\n\n".join(pages_text)
+            return pages_text
+    except Cancelled:
+        raise
     except Exception as e:
         if "no extractable text" in str(e):
             raise
         raise ValueError(f"Failed to extract text from PDF: {e}") from e
 
 
+def extract_text_from_pdf(pdf_input: str | Path | BinaryIO) -> str:
+    """
+    Extract raw text from a PDF file.
+
+    Args:
+        pdf_input: File path (str or Path) or file-like object with PDF bytes
+
+    Returns:
+        Raw text string extracted from all pages
+
+    Raises:
+        ValueError: If the PDF cannot be read or contains no text
+    """
+    return "\n\n".join(extract_pages_from_pdf(pdf_input))
+
+
+def extract_pages_from_bytes(pdf_bytes: bytes) -> list[str]:
+    """
+    Extract raw text from PDF bytes, one string per page.
+
+    Args:
+        pdf_bytes: Raw PDF file bytes
+
+    Returns:
+        Text of each page that has extractable text
+    """
+    return extract_pages_from_pdf(io.BytesIO(pdf_bytes))
+
+
 def extract_text_from_bytes(pdf_bytes: bytes) -> str:
     """
     Extract raw text from PDF bytes.
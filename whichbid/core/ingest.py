@@ -0,0 +1,292 @@
+"""Per-format document readers: structured files skip extraction and the LLM."""
+
+import csv
+import io
+import re
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from pydantic import ValidationError
+
+from core.deadline import check_deadline
+from core.extractor import extract_pages_from_bytes
+from core.models import ParsedQuote
+from core.repair import coerce_number, coerce_parsed_quote, infer_category
+from core.tracing import span
+
+
+SUPPORTED_EXTENSIONS = (".pdf", ".csv", ".xlsx", ".txt")
+
+# Normalized header text -> QuoteLineItem field
+HEADER_ALIASES = {
+    "description": "description",
+    "item": "description",
+    "item description": "description",
+    "service": "description",
+    "product": "description",
+    "details": "description",
+    "category": "category",
+    "type": "category",
+    "quantity": "quantity",
+    "qty": "quantity",
+    "units": "quantity",
+    "hours": "quantity",
+    "unit price": "unit_price",
+    "unit cost": "unit_price",
+    "price each": "unit_price",
+    "rate": "unit_price",
+    "price": "unit_price",
+    "total": "total",
+    "line total": "total",
+    "amount": "total",
+    "total price": "total",
+    "extended price": "total",
+    "cost": "total",
+}
+
+# Label text (in the description column or any cell) -> ParsedQuote field
+SUMMARY_LABELS = {
+    "subtotal": "subtotal",
+    "sub total": "subtotal",
+    "tax": "tax",
+    "sales tax": "tax",
+    "vat": "tax",
+    "total": "total",
+    "grand total": "total",
+    "total due": "total",
+    "amount due": "total",
+}
+
+# "Label: value" metadata rows above the line-item table
+METADATA_LABELS = {
+    "vendor": "vendor_name",
+    "vendor name": "vendor_name",
+    "company": "vendor_name",
+    "supplier": "vendor_name",
+    "contractor": "vendor_name",
+    "from": "vendor_name",
+    "date": "quote_date",
+    "quote date": "quote_date",
+    "valid until": "valid_until",
+    "expires": "valid_until",
+    "payment terms": "payment_terms",
+    "terms": "payment_terms",
+    "timeline": "timeline",
+    "notes": "notes",
+}
+
+# How far down a sheet to look for the header row
+HEADER_SCAN_ROWS = 30
+
+Row = list[Any]
+
+
+def load_document(data: bytes, filename: str) -> ParsedQuote | list[str]:
+    """
+    Read a quote document, choosing a reader by file extension.
+
+    Args:
+        data: Raw file bytes
+        filename: Original file name, used for the extension and as a
+            fallback vendor name
+
+    Returns:
+        A ParsedQuote when the file is a spreadsheet with recognizable
+        columns, otherwise the document's text as a list of pages for
+        the LLM parser
+
+    Raises:
+        ValueError: If the format is unsupported or the file can't be read
+    """
+    check_deadline("extraction")
+    with span("load document", "extract", filename=filename, bytes=len(data)):
+        return _load_document(data, filename)
+
+
+def _load_document(data: bytes, filename: str) -> ParsedQuote | list[str]:
+    suffix = Path(filename).suffix.lower()
+    if suffix == ".pdf":
+        return extract_pages_from_bytes(data)
+    if suffix == ".txt":
+        return _read_text(data)
+    if suffix == ".csv":
+        rows = _read_csv(data)
+    elif suffix == ".xlsx":
+        rows = _read_xlsx(data)
+    else:
+        raise ValueError(
+            f"Unsupported file type '{suffix or filename}'. "
+            f"Supported: {', '.join(SUPPORTED_EXTENSIONS)}"
+        )
+
+    quote = rows_to_quote(rows, default_vendor=_vendor_from_filename(filename))
+    if quote is not None:
+        return quote
+    # No recognizable table: let the LLM make sense of the cells
+    return ["\n".join("\t".join(_cell_text(c) for c in row) for row in rows)]
+
+
+def load_document_file(source: str | Path | BinaryIO) -> ParsedQuote | list[str]:
+    """
+    Read a quote document from a path or file-like object.
+
+    File-like objects without a ``name`` are assumed to be PDFs.
+    """
+    if isinstance(source, (str, Path)):
+        path = Path(source)
+        return load_document(path.read_bytes(), path.name)
+    return load_document(source.read(), getattr(source, "name", "quote.pdf"))
+
+
+def rows_to_quote(rows: list[Row], default_vendor: str) -> ParsedQuote | None:
+    """
+    Map spreadsheet rows straight to a ParsedQuote.
+
+    Looks for a header row naming at least a description and a total (or
+    quantity and unit price) column. Rows above it are read as "label:
+    value" metadata; rows below as line items, except subtotal/tax/total
+    rows which fill the summary fields.
+
+    Returns:
+        The quote, or None if no header row is found or the result fails
+        validation
+    """
+    header_index, columns = _find_header(rows)
+    if header_index is None:
+        return None
+
+    data: dict[str, Any] = {}
+    for row in rows[:header_index]:
+        cells = [_cell_text(c) for c in row if _cell_text(c)]
+        if not cells:
+            continue
+        label, _, value = cells[0].partition(":")
+        value = value.strip() or (cells[1] if len(cells) > 1 else "")
+        field = METADATA_LABELS.get(_normalize(label))
+        if field and value and field not in data:
+            data[field] = value
+
+    items: list[dict] = []
+    for row in rows[header_index + 1:]:
+        if not any(_cell_text(c) for c in row):
+            continue
+        summary = _summary_field(row)
+        if summary:
+            amount = _last_number(row)
+            if amount is not None:
+                data.setdefault(summary, amount)
+            continue
+        item = {
+            field: row[i] for field, i in columns.items() if i < len(row) and row[i] not in (None, "")
+        }
+        if "description" in item:
+            item["description"] = _cell_text(item["description"])
+            if "category" not in columns:
+                item["category"] = infer_category(item["description"])
+        items.append(item)
+
+    data.setdefault("vendor_name", default_vendor)
+    data["line_items"] = items
+    data = coerce_parsed_quote(data)
+    if not data["line_items"]:
+        return None
+    # The whole sheet was read, so a sheet without summary rows is totalled
+    # from its line items (unlike a possibly truncated LLM response)
+    if data.get("subtotal") is None:
+        data["subtotal"] = sum(item["total"] for item in data["line_items"])
+    if data.get("total") is None and isinstance(data["subtotal"], (int, float)):
+        tax = data.get("tax")
+        data["total"] = data["subtotal"] + (tax if isinstance(tax, (int, float)) else 0)
+    try:
+        return ParsedQuote.model_validate(data)
+    except ValidationError:
+        return None
+
+
+def _find_header(rows: list[Row]) -> tuple[int | None, dict[str, int]]:
+    """Find the header row and map line-item fields to column indexes."""
+    for index, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        columns: dict[str, int] = {}
+        for i, cell in enumerate(row):
+            field = HEADER_ALIASES.get(_normalize(_cell_text(cell)))
+            if field and field not in columns:
+                columns[field] = i
+        if "description" in columns and (
+            "total" in columns or {"quantity", "unit_price"} <= columns.keys()
+        ):
+            return index, columns
+    return None, {}
+
+
+def _summary_field(row: Row) -> str | None:
+    for cell in row:
+        field = SUMMARY_LABELS.get(_normalize(_cell_text(cell)))
+        if field:
+            return field
+    return None
+
+
+def _last_number(row: Row) -> Any:
+    """The rightmost cell holding an amount (rates such as "8%" are not amounts)."""
+    for cell in reversed(row):
+        if isinstance(cell, (int, float)) and not isinstance(cell, bool):
+            return cell
+        if isinstance(cell, str) and "%" not in cell and isinstance(coerce_number(cell), float):
+            return cell
+    return None
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^a-z ]", "", text.lower().replace("_", " ")).strip()
+
+
+def _cell_text(cell: Any) -> str:
+    return "" if cell is None else str(cell).strip()
+
+
+def _vendor_from_filename(filename: str) -> str:
+    stem = re.sub(r"^(quote|bid|estimate)[_\- ]+", "", Path(filename).stem, flags=re.IGNORECASE)
+    return re.sub(r"[_\-]+", " ", stem).strip().title() or "Unknown Vendor"
+
+
+def _decode(data: bytes) -> str:
+    for encoding in ("utf-8-sig", "cp1252"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("latin-1")
+
+
+def _read_text(data: bytes) -> list[str]:
+    """Plain text; form feeds separate pages."""
+    pages = [page for page in _decode(data).split("\f") if page.strip()]
+    if not pages:
+        raise ValueError("Text file is empty")
+    return pages
+
+
+def _read_csv(data: bytes) -> list[Row]:
+    text = _decode(data)
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    return [row for row in csv.reader(io.StringIO(text), dialect)]
+
+
+def _read_xlsx(data: bytes) -> list[Row]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise ValueError("Reading .xlsx files requires the openpyxl package") from e
+
+    try:
+        workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    except Exception as e:
+        raise ValueError(f"Failed to read spreadsheet: {e}") from e
+    try:
+        sheet = workbook.active
+        return [list(row) for row in sheet.iter_rows(values_only=True)]
+    finally:
+        workbook.close()
@@ -1,7 +1,24 @@
-"""OpenRouter LLM client wrapper."""
+"""OpenRouter LLM client wrapper, with optional record/replay cassettes."""
 
+import hashlib
+import json
 import os
-from openai import OpenAI
+import socket
+import time
+from pathlib import Path
+from typing import Iterator
+
+from openai import NOT_GIVEN, OpenAI
+
+from core.deadline import check_deadline, current_deadline, on_cancel, remaining_time, sleep
+from core.serialization import write_atomic
+from core.tracing import instant, span
+
+
+CASSETTE_MODES = ("off", "record", "replay")
+
+# Escalate when a model rates its own answer below this (0.0-1.0)
+DEFAULT_MIN_CONFIDENCE = 0.5
 
 
 def get_client() -> OpenAI:
@@ -11,7 +28,7 @@ def get_client() -> OpenAI:
         raise ValueError("OPENROUTER_API_KEY environment variable is required")
 
     return OpenAI(
-        base_url="https://openrouter.ai/api/v1",
+        base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
         api_key=api_key,
     )
 
@@ -19,3 +36,184 @@ def get_client() -> OpenAI:
 def get_model() -> str:
     """Get the model to use from environment or default."""
     return os.getenv("MODEL", "anthropic/claude-sonnet-4")
+
+
+def get_stage_model(stage: str) -> str:
+    """
+    Get the model for a pipeline stage ("parse" or "analyze").
+
+    PARSE_MODEL and ANALYZE_MODEL override MODEL for their stage.
+    """
+    return os.getenv(f"{stage.upper()}_MODEL") or get_model()
+
+
+def get_escalation_model() -> str:
+    """Get the model a stage escalates to (ESCALATION_MODEL, else the analyze model)."""
+    return os.getenv("ESCALATION_MODEL") or get_stage_model("analyze")
+
+
+def get_min_confidence() -> float:
+    """Get the self-reported confidence below which a stage escalates."""
+    return float(os.getenv("MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE))
+
+
+def get_cassette_mode() -> str:
+    """Get the cassette mode (off, record or replay) from environment."""
+    mode = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+    if mode not in CASSETTE_MODES:
+        raise ValueError(f"LLM_CASSETTE_MODE must be one of {', '.join(CASSETTE_MODES)}")
+    return mode
+
+
+def get_cassette_dir() -> Path:
+    """Get the directory cassettes are stored in from environment or default."""
+    return Path(os.getenv("LLM_CASSETTE_DIR", ".cassettes"))
+
+
+def stream_chat(prompt: str, model: str | None = None) -> Iterator[str]:
+    """
+    Stream a JSON-mode chat completion as text chunks.
+
+    Closing the generator early closes the underlying HTTP response,
+    which aborts the generation upstream.
+
+    With LLM_CASSETTE_MODE=record, each response is saved under
+    LLM_CASSETTE_DIR keyed by a hash of the request, including responses
+    the caller stopped reading early (e.g. on malformed output) so replay
+    covers the repair paths too; with replay, responses are served from
+    there without network access.
+
+    Args:
+        prompt: The user message to send
+        model: Model to use (defaults to get_model())
+
+    Yields:
+        Content deltas in the order they arrive
+    """
+    request = {
+        "model": model or get_model(),
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0,
+        "response_format": {"type": "json_object"},
+    }
+    mode = get_cassette_mode()
+    check_deadline("llm request")
+    with span("llm request", "llm", model=request["model"], mode=mode, prompt_chars=len(prompt)) as args:
+        start = time.perf_counter()
+        chunks: list[tuple[float, str]] = []
+        if mode == "replay":
+            source = _replay(request)
+            stream = None
+        else:
+            try:
+                # The deadline bounds each HTTP wait; on_cancel below cuts
+                # the stream off as soon as it passes
+                stream = get_client().chat.completions.create(
+                    **request, stream=True, timeout=remaining_time() or NOT_GIVEN
+                )
+            except Exception:
+                check_deadline("llm request")
+                raise
+            source = (
+                chunk.choices[0].delta.content
+                for chunk in stream
+                if chunk.choices and chunk.choices[0].delta.content
+            )
+        # Record responses that completed or that the caller closed early,
+        # not ones cut off by an error or cancellation
+        finished = False
+        try:
+            with on_cancel(lambda: _abort(stream)):
+                for content in source:
+                    if not chunks:
+                        args["ttfb_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                        instant("llm first byte", "llm")
+                    chunks.append((time.perf_counter() - start, content))
+                    yield content
+                    check_deadline("llm request")
+            finished = True
+        except GeneratorExit:
+            deadline = current_deadline()
+            finished = deadline is None or not deadline.cancelled
+            raise
+        except Exception:
+            # A stream closed by cancellation surfaces as a connection error
+            check_deadline("llm request")
+            raise
+        finally:
+            if stream is not None:
+                stream.close()
+            args["chunks"] = len(chunks)
+            args["completion_chars"] = sum(len(content) for _, content in chunks)
+            if finished and mode == "record":
+                _record(request, chunks)
+
+
+def _abort(stream) -> None:
+    """
+    Unblock a read in progress on another thread.
+
+    Closing the response from another thread doesn't interrupt a blocked
+    read, so shut the connection's socket down instead; the reading
+    thread then fails fast and closes the stream itself.
+    """
+    if stream is None:
+        return
+    network_stream = stream.response.extensions.get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def cassette_key(request: dict) -> str:
+    """Hash a normalized chat-completion request into a cassette key."""
+    normalized = json.dumps(request, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def _cassette_path(request: dict) -> Path:
+    return get_cassette_dir() / f"{cassette_key(request)}.json"
+
+
+def _record(request: dict, chunks: list[tuple[float, str]]) -> None:
+    """Save a request/response pair to its cassette file."""
+    path = _cassette_path(request)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cassette = {
+        "request": request,
+        "chunks": [{"t": round(t, 4), "content": content} for t, content in chunks],
+    }
+    write_atomic(path, cassette)
+
+
+def _replay(request: dict) -> Iterator[str]:
+    """
+    Serve a recorded response, optionally simulating latency.
+
+    LLM_REPLAY_LATENCY may be unset or 0 (no delay), a number of seconds
+    to wait before the first chunk, or "recorded" to reproduce the
+    original chunk timing.
+    """
+    path = _cassette_path(request)
+    if not path.exists():
+        raise ValueError(f"No recorded LLM response for request {path.stem} in {path.parent}")
+    cassette = json.loads(path.read_text())
+
+    latency = os.getenv("LLM_REPLAY_LATENCY", "0")
+    if latency == "recorded":
+        start = time.perf_counter()
+        for chunk in cassette["chunks"]:
+            delay = chunk["t"] - (time.perf_counter() - start)
+            if delay > 0:
+                sleep(delay)
+            yield chunk["content"]
+        return
+
+    delay = float(latency)
+    if delay > 0:
+        sleep(delay)
+    for chunk in cassette["chunks"]:
+        yield chunk["content"]
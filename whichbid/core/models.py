@@ -66,6 +66,18 @@ class RankedQuote(BaseModel):
     cons: list[str]
 
 
+class StageModel(BaseModel):
+    """Which model served one LLM stage, and why it was escalated if it was."""
+    stage: str = Field(description="'parse' or 'analyze'")
+    subject: str | None = Field(default=None, description="Vendor, for parse stages")
+    model: str
+    escalated_from: str | None = Field(
+        default=None,
+        description="The cheaper model that was tried first"
+    )
+    reason: str | None = Field(default=None, description="Why the stage escalated")
+
+
 class QuoteAnalysis(BaseModel):
     """The final output - the standard format businesses consume."""
     criteria_used: ComparisonCriteria = Field(
@@ -78,4 +90,82 @@ class QuoteAnalysis(BaseModel):
     recommendation: str = Field(description="Plain-English best-value recommendation")
     reasoning: str = Field(description="Step-by-step explanation tied to user criteria")
     confidence: float = Field(ge=0, le=1, description="Confidence score 0.0-1.0")
-    caveats: list[str]
\ No newline at end of file
+    caveats: list[str]
+    models_used: list[StageModel] = Field(
+        default_factory=list,
+        description="Model that served each LLM stage (filled in by the pipeline)"
+    )
+
+
+class CriteriaGrid(BaseModel):
+    """Criteria variants to sweep, relative to a base ComparisonCriteria."""
+    priorities: list[list[str]] | None = Field(
+        default=None,
+        description="Alternative priority orders to try"
+    )
+    permute_priorities: bool = Field(
+        default=False,
+        description="Try every ordering of the base priorities"
+    )
+    budget_limit: list[float | None] | None = Field(
+        default=None,
+        description="Alternative budget limits to try (null for no limit)"
+    )
+    must_include: list[list[str] | None] | None = Field(
+        default=None,
+        description="Alternative required-item lists to try"
+    )
+    variants: list[ComparisonCriteria] = Field(
+        default_factory=list,
+        description="Explicit variants, added after the grid combinations"
+    )
+
+
+class VariantResult(BaseModel):
+    """Local scores for every vendor under one criteria variant."""
+    index: int
+    criteria: ComparisonCriteria
+    scores: dict[str, float] = Field(description="Vendor -> 0-100 score")
+    ranking: list[str] = Field(description="Vendors, best first")
+    winner: str
+    rank_agreement: float = Field(
+        ge=-1, le=1, description="Kendall tau between this ranking and the base ranking"
+    )
+
+
+class WinnerFlip(BaseModel):
+    """A variant whose winner differs from the base criteria's winner."""
+    variant: int
+    changes: list[str] = Field(description="How the variant differs from the base criteria")
+    winner: str
+    base_winner: str
+
+
+class VendorStability(BaseModel):
+    """How a vendor fares across all variants."""
+    vendor: str
+    wins: int
+    best_rank: int
+    worst_rank: int
+    mean_score: float
+
+
+class SweepResult(BaseModel):
+    """Outcome of scoring quotes under many criteria variants."""
+    vendors: list[str]
+    variants: list[VariantResult] = Field(description="Variant 0 is the base criteria")
+    stability: float = Field(
+        ge=0, le=1, description="Fraction of variants with the base winner"
+    )
+    rank_agreement: float = Field(
+        ge=-1, le=1, description="Mean Kendall tau against the base ranking"
+    )
+    vendor_stability: list[VendorStability]
+    flips: list[WinnerFlip]
+    unscored_priorities: list[str] = Field(
+        description="Priorities with no local measure; only the LLM analysis weighs them"
+    )
+    analyses: dict[int, QuoteAnalysis] = Field(
+        default_factory=dict,
+        description="Full LLM analyses for the variants that were asked to be explained"
+    )
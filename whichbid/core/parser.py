@@ -1,17 +1,31 @@
 """LLM-based quote parsing: raw text -> ParsedQuote."""
 
-import json
+import os
+import re
+from contextlib import closing
+from typing import Any
 
-from core.llm import get_client, get_model
-from core.models import ParsedQuote
+from pydantic import ValidationError
 
+from core.deadline import Cancelled
+from core.llm import get_escalation_model, get_min_confidence, get_stage_model, stream_chat
+from core.models import ParsedQuote, QuoteLineItem, StageModel
+from core.preprocess import estimate_tokens
+from core.repair import (
+    check_totals,
+    coerce_confidence,
+    coerce_line_item,
+    coerce_number,
+    coerce_parsed_quote,
+    is_number,
+    retry_invalid_fields,
+)
+from core.serialization import schema_json
+from core.streaming import IncrementalJSONParser, MalformedJSONError, PartialCallback
+from core.tracing import span
 
-PARSE_PROMPT = """You are a quote parsing assistant. Extract structured data from the following vendor quote text.
-
-Return a JSON object matching this exact schema:
-{schema}
 
-Guidelines:
+PARSE_GUIDELINES = """Guidelines:
 - vendor_name: The company or person providing the quote
 - quote_date: Date the quote was issued (ISO format if possible)
 - valid_until: Expiration date of the quote
@@ -28,21 +42,83 @@ Guidelines:
 - timeline: Project timeline or delivery date
 - notes: Any other important information
 
+- confidence: 0.0-1.0, how sure you are that every line item and amount was extracted exactly
+
 If a field is not present in the quote, use null.
-Be precise with numbers - extract exact values from the text.
+Be precise with numbers - extract exact values from the text."""
+
+PARSE_PROMPT = """You are a quote parsing assistant. Extract structured data from the following vendor quote text.
+
+Return a JSON object matching this exact schema:
+{schema}
+
+""" + PARSE_GUIDELINES + """
 
 Quote text:
 {text}
 
 Return only valid JSON, no other text."""
 
+BATCH_PARSE_PROMPT = """You are a quote parsing assistant. Extract structured data from each of the following vendor quote documents.
+
+Return a JSON object of the form {{"quotes": [...]}} with exactly one entry per document.
+Each entry must have a "document" field with the document number from its header, plus the fields of this schema:
+{schema}
+
+""" + PARSE_GUIDELINES + """
+Each document is a separate quote: never merge documents or skip one.
+
+{documents}
+
+Return only valid JSON, no other text."""
+
+PAGES_PARSE_PROMPT = """You are a quote parsing assistant. The following pages are excerpts from a longer vendor quote; the rest of the quote is unchanged and already parsed.
+
+Return a JSON object with:
+- line_items: every line item that appears on these pages, each with the fields of this schema plus "page" (the page number from its header):
+{schema}
+- subtotal, tax, total, payment_terms, timeline, notes: only if they appear on these pages, otherwise null
+
+Line item guidelines:
+- category: One of "labor", "materials", "permits", "equipment", "other"
+- quantity / unit_price: null if not specified
+Be precise with numbers - extract exact values from the text.
+
+{pages}
+
+Return only valid JSON, no other text."""
 
-def parse_quote(raw_text: str) -> ParsedQuote:
+# Quote fields a page excerpt may override
+PAGE_FIELDS = ("subtotal", "tax", "total", "payment_terms", "timeline", "notes")
+
+# Default token budget for a batched parse request; 0 disables batching
+DEFAULT_BATCH_TOKENS = 0
+
+# Amounts in source text, to check a batched entry's total against
+AMOUNT_TOKEN = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?")
+
+
+def parse_quote(raw_text: str, on_partial: PartialCallback | None = None) -> ParsedQuote:
     """
     Parse raw quote text into a structured ParsedQuote.
 
+    The completion is streamed and each line item is validated as soon as
+    it is complete. Malformed output aborts the stream early; whatever
+    arrived is then repaired and coerced locally, and only the fields that
+    still fail validation are requested again.
+
+    The quote is parsed with the parse-stage model. If its answer was cut
+    off, malformed or fails validation, its totals don't add up, or it
+    rates its own confidence below MIN_CONFIDENCE, the quote is parsed
+    again with the escalation model (when that is a different model).
+    Partial results of an attempt that may still escalate are held back
+    until it is accepted, so callers never see two sets of line items.
+
     Args:
         raw_text: Raw text extracted from a quote PDF
+        on_partial: Optional callback receiving ("line_item", QuoteLineItem)
+            for each line item as it arrives and ("model", StageModel)
+            once the quote is parsed
 
     Returns:
         ParsedQuote with structured data
@@ -50,31 +126,363 @@ def parse_quote(raw_text: str) -> ParsedQuote:
     Raises:
         ValueError: If parsing fails
     """
-    client = get_client()
-    model = get_model()
+    with span("build prompt", prompt="parse"):
+        prompt = PARSE_PROMPT.format(
+            schema=schema_json(ParsedQuote),
+            text=raw_text
+        )
+
+    model = get_stage_model("parse")
+    escalation = get_escalation_model()
+
+    try:
+        if escalation == model:
+            quote, _ = _parse_with(model, prompt, raw_text, on_partial, repair=True)
+            used = StageModel(stage="parse", subject=quote.vendor_name, model=model)
+        else:
+            held: list[tuple[str, Any]] = []
+            quote, reason = _parse_with(
+                model, prompt, raw_text, lambda kind, value: held.append((kind, value)), repair=False
+            )
+            if reason is None:
+                if on_partial is not None:
+                    for kind, value in held:
+                        on_partial(kind, value)
+                used = StageModel(stage="parse", subject=quote.vendor_name, model=model)
+            else:
+                quote, _ = _parse_with(escalation, prompt, raw_text, on_partial, repair=True)
+                used = StageModel(
+                    stage="parse", subject=quote.vendor_name, model=escalation,
+                    escalated_from=model, reason=reason,
+                )
+        if on_partial is not None:
+            on_partial("model", used)
+        return quote
+
+    except Cancelled:
+        raise
+    except Exception as e:
+        raise ValueError(f"Quote parsing failed: {e}") from e
 
-    schema = ParsedQuote.model_json_schema()
-    prompt = PARSE_PROMPT.format(
-        schema=json.dumps(schema, indent=2),
-        text=raw_text
+
+def _parse_with(
+    model: str,
+    prompt: str,
+    raw_text: str,
+    on_partial: PartialCallback | None,
+    repair: bool,
+) -> tuple[ParsedQuote | None, str | None]:
+    """
+    One parse attempt with one model.
+
+    With ``repair`` off, output that had to be salvaged (cut off, aborted
+    as malformed, or missing its totals) or fails validation is a reason
+    to escalate, and is not repaired. With it on, invalid fields are
+    retried, and so are the line items of salvaged output whose totals
+    don't add up.
+
+    Returns:
+        The quote (None when escalating without one) and the reason to
+        escalate, if any
+    """
+    decoder = IncrementalJSONParser(
+        watch={("line_items", "*")}, on_value=_line_item_emitter(on_partial)
     )
+    aborted = False
+    try:
+        with closing(stream_chat(prompt, model)) as chunks:
+            decoder.feed_all(chunks)
+    except MalformedJSONError:
+        # Stop paying for a broken generation; salvage what arrived
+        aborted = True
+
+    if not repair:
+        if aborted:
+            return None, "malformed response"
+        if not decoder.complete:
+            return None, "response was cut off"
+
+    try:
+        with span("json decode", chars=len(decoder.text)):
+            data = coerce_parsed_quote(decoder.close())
+    except ValueError as e:
+        if not repair:
+            return None, f"unreadable response ({e})"
+        raise
+    if not isinstance(data, dict):
+        if not repair:
+            return None, "response was not a JSON object"
+        raise ValueError("LLM response was not a JSON object")
+    if not repair and (data.get("subtotal") is None or data.get("total") is None):
+        return None, "response has no totals"
 
+    # Salvaged line items may be incomplete, so ask for them again with
+    # any other fields that need it
+    salvaged = {"line_items": "the response was cut off, so this list may be incomplete"}
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-            response_format={"type": "json_object"},
+        with span("validate", model="ParsedQuote"):
+            quote = ParsedQuote.model_validate(data)
+    except ValidationError as e:
+        if not repair:
+            return None, f"invalid response ({e.error_count()} field errors)"
+        problems = salvaged if aborted or not decoder.complete else None
+        data = retry_invalid_fields(ParsedQuote, data, e, raw_text, model, problems)
+        quote = ParsedQuote.model_validate(coerce_parsed_quote(data))
+    else:
+        if (aborted or not decoder.complete) and not check_totals(quote):
+            data = retry_invalid_fields(ParsedQuote, data, None, raw_text, model, salvaged)
+            quote = ParsedQuote.model_validate(coerce_parsed_quote(data))
+
+    if not check_totals(quote):
+        return quote, "line items and totals don't add up"
+    confidence = coerce_confidence(data.get("confidence"))
+    threshold = get_min_confidence()
+    if is_number(confidence) and confidence < threshold:
+        return quote, f"confidence {confidence:.2f} below {threshold:.2f}"
+    return quote, None
+
+
+def _line_item_emitter(on_partial: PartialCallback | None):
+    """An IncrementalJSONParser callback reporting each valid line item."""
+    def emit(path, value) -> None:
+        item = coerce_line_item(value)
+        if item is None or on_partial is None:
+            return
+        try:
+            on_partial("line_item", QuoteLineItem.model_validate(item))
+        except ValidationError:
+            pass
+
+    return emit
+
+
+def get_batch_tokens() -> int:
+    """Get the batched parse token budget from environment (0 disables)."""
+    return int(os.getenv("PARSE_BATCH_TOKENS", DEFAULT_BATCH_TOKENS))
+
+
+def parse_quotes(
+    raw_texts: list[str],
+    on_partial: PartialCallback | None = None,
+    batch_tokens: int | None = None,
+) -> list[ParsedQuote]:
+    """
+    Parse several quote texts, packing short ones into shared LLM requests.
+
+    Documents are grouped greedily so that each group's text stays within
+    ``batch_tokens``. A group of one, or any document the batched response
+    dropped, merged or got wrong, is parsed on its own with parse_quote.
+
+    Args:
+        raw_texts: Raw text of each quote
+        on_partial: Optional callback receiving ("line_item", QuoteLineItem)
+            and ("model", StageModel) for each quote
+        batch_tokens: Token budget per batched request (defaults to the
+            PARSE_BATCH_TOKENS environment variable; 0 disables batching)
+
+    Returns:
+        One ParsedQuote per input text, in input order
+
+    Raises:
+        ValueError: If parsing any document fails
+    """
+    if batch_tokens is None:
+        batch_tokens = get_batch_tokens()
+    if batch_tokens <= 0:
+        return [parse_quote(text, on_partial) for text in raw_texts]
+
+    groups: list[list[int]] = []
+    group: list[int] = []
+    group_tokens = 0
+    for i, text in enumerate(raw_texts):
+        tokens = estimate_tokens(text)
+        if group and group_tokens + tokens > batch_tokens:
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(i)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+
+    results: dict[int, ParsedQuote] = {}
+    for group in groups:
+        if len(group) > 1:
+            results.update(_parse_batch(group, raw_texts, on_partial))
+        for i in group:
+            if i not in results:
+                results[i] = parse_quote(raw_texts[i], on_partial)
+
+    return [results[i] for i in range(len(raw_texts))]
+
+
+def _parse_batch(
+    group: list[int],
+    raw_texts: list[str],
+    on_partial: PartialCallback | None,
+) -> dict[int, ParsedQuote]:
+    """
+    Parse a group of documents in one request.
+
+    Returns only the documents that came back exactly once, valid, and
+    naming the vendor and total found in their own text; the caller falls
+    back to single-document parsing for the rest. Line items are reported
+    only for the documents returned, so fallbacks don't report them twice.
+    """
+    # Documents are numbered from 1 within the request
+    documents = "\n\n".join(
+        f"### Document {n}\n{raw_texts[i]}" for n, i in enumerate(group, 1)
+    )
+    with span("build prompt", prompt="batch parse", documents=len(group)):
+        prompt = BATCH_PARSE_PROMPT.format(
+            schema=schema_json(ParsedQuote),
+            documents=documents,
         )
 
-        content = response.choices[0].message.content
-        if not content:
-            raise ValueError("LLM returned empty response")
+    decoder = IncrementalJSONParser()
+    model = get_stage_model("parse")
+
+    try:
+        try:
+            with closing(stream_chat(prompt, model)) as chunks:
+                decoder.feed_all(chunks)
+        except MalformedJSONError:
+            pass
+        with span("json decode", chars=len(decoder.text)):
+            data = decoder.close()
+    except ValueError:
+        # Nothing usable came back; every document falls back
+        return {}
 
-        data = json.loads(content)
-        return ParsedQuote.model_validate(data)
+    entries = data.get("quotes") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return {}
 
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Failed to parse LLM response as JSON: {e}") from e
+    by_number: dict[int, list[dict]] = {}
+    for entry in entries:
+        if isinstance(entry, dict):
+            number = _document_number(entry.get("document"))
+            if number is not None:
+                by_number.setdefault(number, []).append(entry)
+
+    # Doubtful entries fall back to parse_quote, which can escalate
+    escalates = get_escalation_model() != model
+    parsed: dict[int, ParsedQuote] = {}
+    for n, i in enumerate(group, 1):
+        matches = by_number.get(n, [])
+        if len(matches) != 1:
+            continue
+        data = coerce_parsed_quote(matches[0])
+        try:
+            with span("validate", model="ParsedQuote", document=n):
+                quote = ParsedQuote.model_validate(data)
+        except ValidationError:
+            continue
+        # Catch entries that merged documents or carry another document's data
+        if not _matches_source(quote, raw_texts[i]):
+            continue
+        # An entry salvaged from a cut-off response may be missing line items
+        if not decoder.complete and not check_totals(quote):
+            continue
+        confidence = coerce_confidence(data.get("confidence"))
+        if escalates and (
+            not check_totals(quote)
+            or (is_number(confidence) and confidence < get_min_confidence())
+        ):
+            continue
+        parsed[i] = quote
+        if on_partial is not None:
+            for item in quote.line_items:
+                on_partial("line_item", item)
+            on_partial("model", StageModel(stage="parse", subject=quote.vendor_name, model=model))
+    return parsed
+
+
+def _document_number(value) -> int | None:
+    """A batched entry's document number, accepting numeric strings."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+
+def _matches_source(quote: ParsedQuote, text: str) -> bool:
+    """Whether a quote names the vendor in ``text`` and a total that appears there."""
+    words = " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+    vendor = " ".join(re.findall(r"[a-z0-9]+", quote.vendor_name.lower()))
+    if not vendor or f" {vendor} " not in f" {words} ":
+        return False
+    return any(
+        abs(float(match.group().replace(",", "")) - quote.total) <= 0.01
+        for match in AMOUNT_TOKEN.finditer(text)
+    )
+
+
+def parse_pages(
+    pages: dict[int, str],
+    on_partial: PartialCallback | None = None,
+) -> tuple[dict[int, list[QuoteLineItem]], dict]:
+    """
+    Parse only some pages of a quote.
+
+    Args:
+        pages: Page text keyed by 1-based page number
+        on_partial: Optional callback receiving ("line_item", QuoteLineItem)
+            and ("model", StageModel)
+
+    Returns:
+        Line items keyed by the page they appear on, and whichever of
+        PAGE_FIELDS the pages contain (others are omitted)
+
+    Raises:
+        ValueError: If parsing fails
+    """
+    with span("build prompt", prompt="pages parse", pages=len(pages)):
+        prompt = PAGES_PARSE_PROMPT.format(
+            schema=schema_json(QuoteLineItem),
+            pages="\n\n".join(f"### Page {n}\n{text}" for n, text in sorted(pages.items())),
+        )
+
+    decoder = IncrementalJSONParser(
+        watch={("line_items", "*")}, on_value=_line_item_emitter(on_partial)
+    )
+    model = get_stage_model("parse")
+
+    try:
+        try:
+            with closing(stream_chat(prompt, model)) as chunks:
+                decoder.feed_all(chunks)
+        except MalformedJSONError:
+            pass
+        # Not coerce_parsed_quote: that would derive totals from a fragment
+        with span("json decode", chars=len(decoder.text)):
+            data = decoder.close()
+    except Cancelled:
+        raise
     except Exception as e:
-        raise ValueError(f"Quote parsing failed: {e}") from e
+        raise ValueError(f"Page parsing failed: {e}") from e
+    if not isinstance(data, dict):
+        raise ValueError("Page parsing failed: response was not a JSON object")
+    if on_partial is not None:
+        subject = "pages " + ", ".join(str(n) for n in sorted(pages))
+        on_partial("model", StageModel(stage="parse", subject=subject, model=model))
+
+    first_page = min(pages)
+    items: dict[int, list[QuoteLineItem]] = {n: [] for n in pages}
+    for raw in data.get("line_items") or []:
+        item = coerce_line_item(raw)
+        if item is None:
+            raise ValueError(f"Page parsing failed: invalid line item {raw!r}")
+        page = item.get("page")
+        items[page if page in items else first_page].append(QuoteLineItem.model_validate(item))
+
+    fields = {
+        key: coerce_number(data[key]) if key in ("subtotal", "tax", "total") else data[key]
+        for key in PAGE_FIELDS
+        if data.get(key) is not None
+    }
+    return items, fields
@@ -1,82 +1,299 @@
-"""Pipeline orchestrator: extract -> parse -> analyze."""
+"""Pipeline orchestrator: ingest -> preprocess -> template/revision/LLM parse -> analyze."""
 
 from pathlib import Path
 from typing import BinaryIO
 
 from core.analyzer import analyze_quotes
-from core.extractor import extract_text_from_bytes, extract_text_from_pdf
-from core.models import ComparisonCriteria, ParsedQuote, QuoteAnalysis
-from core.parser import parse_quote
+from core.deadline import check_deadline
+from core.ingest import load_document, load_document_file
+from core.models import (
+    ComparisonCriteria,
+    CriteriaGrid,
+    ParsedQuote,
+    QuoteAnalysis,
+    StageModel,
+    SweepResult,
+)
+from core.parser import parse_quotes
+from core.preprocess import preprocess_pages
+from core.revisions import parse_revision, record_revision
+from core.streaming import PartialCallback
+from core.sweep import expand_grid, sweep_criteria
+from core.templates import learn_template, parse_with_templates
+from core.tracing import span
 
 
 def run(
-    pdf_files: list[str | Path | BinaryIO],
-    criteria: ComparisonCriteria | None = None
+    files: list[str | Path | BinaryIO],
+    criteria: ComparisonCriteria | None = None,
+    on_partial: PartialCallback | None = None,
+    drop_terms: bool = False,
 ) -> QuoteAnalysis:
     """
     Run the full quote comparison pipeline.
 
     Args:
-        pdf_files: List of PDF file paths or file-like objects
+        files: List of quote file paths or file-like objects (PDF, CSV,
+            XLSX or plain text)
         criteria: User-defined comparison criteria (optional)
+        on_partial: Optional callback receiving partial results as the
+            LLM streams them (see parse_quote and analyze_quotes), plus
+            ("preprocess", PreprocessResult) for each unstructured document,
+            ("template", vendor_name) for each quote parsed from a learned
+            vendor template and ("revision", RevisionReport) for each
+            revision of an earlier quote
+        drop_terms: Drop terms-and-conditions sections before parsing
 
     Returns:
         QuoteAnalysis with complete comparison results
 
     Raises:
         ValueError: If extraction, parsing, or analysis fails
+        Cancelled: If the deadline installed with core.deadline.deadline_scope
+            passes (DeadlineExceeded) or the run is cancelled; every LLM
+            call is bounded by it
     """
-    if not pdf_files:
-        raise ValueError("At least one PDF file is required")
+    if not files:
+        raise ValueError("At least one quote file is required")
 
-    # Step 1: Extract text from all PDFs
-    raw_texts: list[str] = []
-    for pdf in pdf_files:
-        text = extract_text_from_pdf(pdf)
-        raw_texts.append(text)
+    # Step 1: Read every document; structured spreadsheets come back parsed
+    documents = _load_files(files)
 
-    # Step 2: Parse each quote (one LLM call per quote)
-    parsed_quotes: list[ParsedQuote] = []
-    for text in raw_texts:
-        quote = parse_quote(text)
-        parsed_quotes.append(quote)
-
-    # Step 3: Analyze and compare all quotes (one LLM call)
-    analysis = analyze_quotes(parsed_quotes, criteria)
-
-    return analysis
+    return _run_documents(documents, criteria, on_partial, drop_terms)
 
 
 def run_from_bytes(
     pdf_bytes_list: list[bytes],
-    criteria: ComparisonCriteria | None = None
+    criteria: ComparisonCriteria | None = None,
+    on_partial: PartialCallback | None = None,
+    drop_terms: bool = False,
+    filenames: list[str] | None = None,
 ) -> QuoteAnalysis:
     """
-    Run the pipeline from raw PDF bytes.
+    Run the pipeline from raw file bytes.
 
     Args:
-        pdf_bytes_list: List of raw PDF file bytes
+        pdf_bytes_list: List of raw file bytes
         criteria: User-defined comparison criteria (optional)
+        on_partial: Optional callback receiving partial results as the
+            LLM streams them (see parse_quote and analyze_quotes), plus
+            ("preprocess", PreprocessResult) for each unstructured document,
+            ("template", vendor_name) for each quote parsed from a learned
+            vendor template and ("revision", RevisionReport) for each
+            revision of an earlier quote
+        drop_terms: Drop terms-and-conditions sections before parsing
+        filenames: Original file names, used to pick a reader per file
+            (all files are treated as PDFs if omitted)
 
     Returns:
         QuoteAnalysis with complete comparison results
     """
     if not pdf_bytes_list:
-        raise ValueError("At least one PDF is required")
+        raise ValueError("At least one quote file is required")
+
+    # Step 1: Read every document
+    documents = _load_bytes(pdf_bytes_list, filenames)
+
+    return _run_documents(documents, criteria, on_partial, drop_terms)
+
+
+def sweep(
+    files: list[str | Path | BinaryIO],
+    criteria: ComparisonCriteria | None = None,
+    grid: CriteriaGrid | None = None,
+    explain: list[int] | None = None,
+    on_partial: PartialCallback | None = None,
+    drop_terms: bool = False,
+) -> SweepResult:
+    """
+    Parse quotes once and score them under many criteria variants.
+
+    Scoring is local (see core.sweep); the LLM analysis only runs for the
+    variants listed in ``explain``.
+
+    Args:
+        files: List of quote file paths or file-like objects
+        criteria: Base comparison criteria (variant 0)
+        grid: Variants to try relative to the base criteria
+        explain: Variant indexes to run the full LLM analysis for
+        on_partial: Optional callback receiving partial results (see run)
+        drop_terms: Drop terms-and-conditions sections before parsing
+
+    Returns:
+        SweepResult, with an analysis for each explained variant
+
+    Raises:
+        ValueError: If extraction, parsing, or analysis fails, or an
+            explained variant doesn't exist
+        Cancelled: If the active deadline passes or the run is cancelled
+    """
+    if not files:
+        raise ValueError("At least one quote file is required")
+
+    documents = _load_files(files)
+    return _sweep_documents(documents, criteria, grid, explain, on_partial, drop_terms)
+
+
+def sweep_from_bytes(
+    pdf_bytes_list: list[bytes],
+    criteria: ComparisonCriteria | None = None,
+    grid: CriteriaGrid | None = None,
+    explain: list[int] | None = None,
+    on_partial: PartialCallback | None = None,
+    drop_terms: bool = False,
+    filenames: list[str] | None = None,
+) -> SweepResult:
+    """
+    Run a criteria sweep from raw file bytes.
+
+    See sweep for the arguments; ``filenames`` picks a reader per file
+    (all files are treated as PDFs if omitted).
+    """
+    if not pdf_bytes_list:
+        raise ValueError("At least one quote file is required")
+
+    documents = _load_bytes(pdf_bytes_list, filenames)
+    return _sweep_documents(documents, criteria, grid, explain, on_partial, drop_terms)
+
+
+def _load_files(files: list[str | Path | BinaryIO]) -> list[ParsedQuote | list[str]]:
+    with span("ingest", documents=len(files)):
+        return [load_document_file(f) for f in files]
 
-    # Step 1: Extract text from all PDFs
-    raw_texts: list[str] = []
-    for pdf_bytes in pdf_bytes_list:
-        text = extract_text_from_bytes(pdf_bytes)
-        raw_texts.append(text)
 
-    # Step 2: Parse each quote
-    parsed_quotes: list[ParsedQuote] = []
-    for text in raw_texts:
-        quote = parse_quote(text)
-        parsed_quotes.append(quote)
+def _load_bytes(
+    pdf_bytes_list: list[bytes],
+    filenames: list[str] | None,
+) -> list[ParsedQuote | list[str]]:
+    if filenames is None:
+        filenames = ["quote.pdf"] * len(pdf_bytes_list)
+    with span("ingest", documents=len(pdf_bytes_list)):
+        return [load_document(data, name) for data, name in zip(pdf_bytes_list, filenames)]
+
+
+def _run_documents(
+    documents: list[ParsedQuote | list[str]],
+    criteria: ComparisonCriteria | None,
+    on_partial: PartialCallback | None,
+    drop_terms: bool,
+) -> QuoteAnalysis:
+    """Parse whatever still needs the LLM, then analyze everything."""
+    parsed_quotes, parse_models = _parse_documents(documents, on_partial, drop_terms)
 
-    # Step 3: Analyze and compare
-    analysis = analyze_quotes(parsed_quotes, criteria)
+    # Step 6: Analyze and compare all quotes (one LLM call)
+    check_deadline("analysis")
+    with span("analyze", quotes=len(parsed_quotes)):
+        analysis = analyze_quotes(parsed_quotes, criteria, on_partial)
+    analysis.models_used = parse_models + analysis.models_used
 
     return analysis
+
+
+def _sweep_documents(
+    documents: list[ParsedQuote | list[str]],
+    criteria: ComparisonCriteria | None,
+    grid: CriteriaGrid | None,
+    explain: list[int] | None,
+    on_partial: PartialCallback | None,
+    drop_terms: bool,
+) -> SweepResult:
+    """Parse documents, score every variant locally, then explain the chosen ones."""
+    variants = expand_grid(criteria or ComparisonCriteria(), grid or CriteriaGrid())
+    for index in explain or []:
+        if not 0 <= index < len(variants):
+            raise ValueError(f"No criteria variant {index}; the sweep has {len(variants)}")
+
+    parsed_quotes, parse_models = _parse_documents(documents, on_partial, drop_terms)
+
+    with span("sweep", variants=len(variants)):
+        result = sweep_criteria(parsed_quotes, variants)
+
+    for index in dict.fromkeys(explain or []):
+        check_deadline("analysis")
+        with span("analyze", quotes=len(parsed_quotes), variant=index):
+            analysis = analyze_quotes(parsed_quotes, variants[index], on_partial)
+        analysis.models_used = parse_models + analysis.models_used
+        result.analyses[index] = analysis
+
+    return result
+
+
+def _parse_documents(
+    documents: list[ParsedQuote | list[str]],
+    on_partial: PartialCallback | None,
+    drop_terms: bool,
+) -> tuple[list[ParsedQuote], list[StageModel]]:
+    """
+    Turn every document into a ParsedQuote, using the LLM only where needed.
+
+    Returns:
+        The quotes in document order, and the model that served each
+        LLM parse
+    """
+    pending = [i for i, doc in enumerate(documents) if not isinstance(doc, ParsedQuote)]
+
+    # Pass events through, keeping the model records for the analysis
+    models: list[StageModel] = []
+
+    def collect(kind: str, value) -> None:
+        if kind == "model":
+            models.append(value)
+        if on_partial is not None:
+            on_partial(kind, value)
+
+    check_deadline("parsing")
+
+    # Step 2: Strip layout noise to shrink the parse prompts
+    with span("preprocess", documents=len(pending)):
+        raw_texts = _preprocess([documents[i] for i in pending], drop_terms, on_partial)
+
+    # Step 3: Parse repeat vendors locally from learned layout templates
+    texts = dict(zip(pending, raw_texts))
+    parsed: dict[int, ParsedQuote] = {}
+    with span("templates") as args:
+        for i, text in texts.items():
+            quote = parse_with_templates(text)
+            if quote is not None:
+                parsed[i] = quote
+                collect("template", quote.vendor_name)
+        args["parsed"] = len(parsed)
+
+    # Step 4: For revisions of recorded quotes, reparse only changed pages
+    item_pages: dict[int, list[int]] = {}
+    with span("revisions") as args:
+        for i in pending:
+            if i in parsed:
+                continue
+            revision = parse_revision(documents[i], collect, drop_terms)
+            if revision is not None:
+                parsed[i], item_pages[i], report = revision
+                collect("revision", report)
+        args["parsed"] = len(item_pages)
+
+    # Step 5: Parse the rest with the LLM (one call per quote, or per batch
+    # of short quotes when PARSE_BATCH_TOKENS is set), learning templates
+    remaining = [i for i in pending if i not in parsed]
+    with span("parse", documents=len(remaining)):
+        for i, quote in zip(remaining, parse_quotes([texts[i] for i in remaining], collect)):
+            parsed[i] = quote
+            learn_template(texts[i], quote)
+
+        for i in pending:
+            record_revision(documents[i], parsed[i], item_pages.get(i))
+
+    return [parsed.get(i, doc) for i, doc in enumerate(documents)], models
+
+
+def _preprocess(
+    pages_list: list[list[str]],
+    drop_terms: bool,
+    on_partial: PartialCallback | None,
+) -> list[str]:
+    """Clean each document's pages, reporting the token reduction."""
+    texts: list[str] = []
+    for pages in pages_list:
+        result = preprocess_pages(pages, drop_terms)
+        if on_partial is not None:
+            on_partial("preprocess", result)
+        texts.append(result.text)
+    return texts
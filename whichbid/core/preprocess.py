@@ -0,0 +1,185 @@
+"""Text cleanup between extraction and parsing to cut prompt tokens."""
+
+import math
+import re
+
+from pydantic import BaseModel, Field
+
+
+# Lines with money amounts are never dropped, whatever section they are in
+CURRENCY_PATTERN = re.compile(r"[$€£]\s?\d|\b\d{1,3}(?:,\d{3})*\.\d{2}\b")
+
+# A bare "Terms" heading usually introduces payment terms, so it doesn't count
+TERMS_HEADING_PATTERN = re.compile(
+    r"^(?:(?:standard|general)\s+)?(?:terms\s*(?:and|&)\s*conditions(?:\s+of\s+(?:sale|service))?"
+    r"|t\s*&\s*cs?|legal|disclaimers?|fine print)\s*:?\s*$",
+    re.IGNORECASE,
+)
+
+# A terms section shorter than this is kept; it's probably payment terms
+MIN_TERMS_LINES = 5
+
+# Running headers and footers sit within this many lines of a page edge.
+# Only there do lines that differ in their numbers (page numbers, revision
+# dates) count as repeats, and only at the same position on each page.
+EDGE_LINES = 2
+
+WHITESPACE_RUN = re.compile(r"[ \t\f\v]+")
+DIGITS = re.compile(r"\d+")
+
+# How a line repeats: ("exact", text), or (edge position, text with digits
+# masked) where the position is e.g. "top 0" or "bottom 1"
+RepeatKey = tuple[str, str]
+
+
+class PreprocessResult(BaseModel):
+    """Cleaned quote text and how much it shrank."""
+    text: str = Field(exclude=True)
+    original_tokens: int
+    tokens: int
+    removed_lines: int
+
+    @property
+    def reduction(self) -> float:
+        """Fraction of estimated tokens removed, 0.0-1.0."""
+        if not self.original_tokens:
+            return 0.0
+        return 1 - self.tokens / self.original_tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token)."""
+    return math.ceil(len(text) / 4)
+
+
+def has_currency(line: str) -> bool:
+    """Whether a line contains a currency amount."""
+    return bool(CURRENCY_PATTERN.search(line))
+
+
+def preprocess_pages(pages: list[str], drop_terms: bool = False) -> PreprocessResult:
+    """
+    Strip layout noise from extracted page text before it reaches the LLM.
+
+    Collapses whitespace runs and blank lines, and removes lines repeated
+    across pages (letterhead, running headers and footers, page numbers)
+    after their first occurrence. Optionally drops long terms-and-conditions
+    sections. Lines containing currency amounts are always kept.
+
+    Args:
+        pages: Raw text of each page
+        drop_terms: Also drop terms-and-conditions sections
+
+    Returns:
+        PreprocessResult with the cleaned text and token counts
+    """
+    original = "\n\n".join(pages)
+    page_lines = _page_lines(pages)
+    total_lines = sum(len(lines) for lines in page_lines)
+
+    kept_pages: list[str] = []
+    emitted: set[RepeatKey] = set()
+    for lines, keys in zip(page_lines, _repeat_keys(page_lines)):
+        kept: list[str] = []
+        terms = _terms_start(lines) if drop_terms else None
+        for index, (line, key) in enumerate(zip(lines, keys)):
+            if has_currency(line):
+                kept.append(line)
+                continue
+            if terms is not None and index >= terms:
+                continue
+            if key is not None:
+                if key in emitted:
+                    continue
+                emitted.add(key)
+            kept.append(line)
+        if kept:
+            kept_pages.append("\n".join(kept))
+
+    text = "\n\n".join(kept_pages)
+    kept_lines = sum(len(page.splitlines()) for page in kept_pages)
+    return PreprocessResult(
+        text=text,
+        original_tokens=estimate_tokens(original),
+        tokens=estimate_tokens(text),
+        removed_lines=total_lines - kept_lines,
+    )
+
+
+def page_bodies(pages: list[str]) -> list[str]:
+    """
+    Each page's text without its running headers and footers.
+
+    Used to compare pages across documents: a revision number or date in
+    a header shouldn't make every page look changed. Lines containing
+    currency amounts are always kept.
+    """
+    page_lines = _page_lines(pages)
+    return [
+        "\n".join(
+            line for index, (line, key) in enumerate(zip(lines, keys))
+            if key is None or _edge_key(lines, index) is None or has_currency(line)
+        )
+        for lines, keys in zip(page_lines, _repeat_keys(page_lines))
+    ]
+
+
+def _page_lines(pages: list[str]) -> list[list[str]]:
+    """Each page's non-blank lines with whitespace runs collapsed."""
+    return [
+        [line for line in (WHITESPACE_RUN.sub(" ", raw).strip() for raw in page.splitlines()) if line]
+        for page in pages
+    ]
+
+
+def _repeat_keys(page_lines: list[list[str]]) -> list[list[RepeatKey | None]]:
+    """
+    For each line, the key it repeats under across pages, or None.
+
+    A line repeats if the same text appears on another page, or if it sits
+    near the top or bottom of its page and another page has a line at the
+    same position that differs only in its numbers. Content lines that merely share a
+    shape ("Timeline: 4 weeks", "Timeline: 6 weeks") don't repeat.
+    """
+    exact: dict[str, int] = {}
+    edge: dict[RepeatKey, int] = {}
+    for lines in page_lines:
+        for line in set(lines):
+            exact[line] = exact.get(line, 0) + 1
+        for key in {_edge_key(lines, i) for i in range(len(lines))} - {None}:
+            edge[key] = edge.get(key, 0) + 1
+
+    keys: list[list[RepeatKey | None]] = []
+    for lines in page_lines:
+        page_keys: list[RepeatKey | None] = []
+        for index, line in enumerate(lines):
+            key = _edge_key(lines, index)
+            if exact[line] > 1:
+                page_keys.append(("exact", line))
+            elif key is not None and edge[key] > 1:
+                page_keys.append(key)
+            else:
+                page_keys.append(None)
+        keys.append(page_keys)
+    return keys
+
+
+def _edge_key(lines: list[str], index: int) -> RepeatKey | None:
+    """The position and masked text of a line near a page edge, else None."""
+    if index < EDGE_LINES:
+        position = f"top {index}"
+    elif index >= len(lines) - EDGE_LINES:
+        position = f"bottom {len(lines) - 1 - index}"
+    else:
+        return None
+    return position, DIGITS.sub("#", lines[index])
+
+
+def _terms_start(lines: list[str]) -> int | None:
+    """Where a terms section (heading to end of page) starts, if long enough to drop."""
+    for start, line in enumerate(lines):
+        if TERMS_HEADING_PATTERN.match(line):
+            if len(lines) - start < MIN_TERMS_LINES:
+                return None
+            return start
+    return None
@@ -0,0 +1,418 @@
+"""Local repair and coercion of LLM JSON output before validation."""
+
+import json
+import re
+from typing import Any
+
+from pydantic import BaseModel, ValidationError
+
+from core.llm import stream_chat
+from core.models import ParsedQuote
+from core.serialization import dumps, loads, schema_json
+
+
+# Arithmetic checks allow for rounding to the cent, not a share of the amount
+CENT_TOLERANCE = 0.01
+
+# A confidence above this (or a whole number above 1) is read as a
+# percentage; anything between 1.0 and this is clamped to 1.0
+PERCENT_CONFIDENCE = 1.5
+
+CATEGORIES = ("labor", "materials", "permits", "equipment", "other")
+
+# One amount: optional sign or parentheses, currency, thousands separators
+# and a single decimal point. Rates ("8.25%"), ranges ("$500-$1,000"),
+# several numbers and numbers inside text don't match.
+AMOUNT_PATTERN = re.compile(
+    r"(?P<open>\()?\s*(?P<sign>-)?\s*(?:[$€£]|USD|EUR|GBP|CAD|AUD)?\s*(?P<sign2>-)?\s*"
+    r"(?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+)"
+    r"\s*(?:USD|EUR|GBP|CAD|AUD)?\s*(?P<close>\))?",
+    re.IGNORECASE,
+)
+
+CATEGORY_ALIASES = {
+    "labour": "labor",
+    "installation": "labor",
+    "service": "labor",
+    "services": "labor",
+    "material": "materials",
+    "supplies": "materials",
+    "permit": "permits",
+    "fees": "permits",
+    "equipment rental": "equipment",
+    "tools": "equipment",
+}
+
+RETRY_PROMPT = """Some fields in a JSON object you produced were missing or invalid.
+
+## Problems
+{errors}
+
+## Current JSON
+{data}
+
+## Source Material
+{context}
+
+## Your Task
+Return a JSON object containing ONLY these top-level keys, with corrected values: {fields}
+The values must match this schema:
+{schema}
+
+Return only valid JSON."""
+
+
+def load_json(text: str) -> Any:
+    """
+    Decode LLM output, repairing common syntax damage if needed.
+
+    Handles markdown code fences, leading prose, trailing commas and
+    output truncated mid-document (incomplete trailing elements are
+    dropped and open containers closed).
+
+    Raises:
+        ValueError: If the text is empty or cannot be repaired
+    """
+    text = text.strip()
+    if not text:
+        raise ValueError("LLM returned empty response")
+    try:
+        return loads(text)
+    except json.JSONDecodeError as e:
+        error = e
+
+    repaired = repair_json(text)
+    try:
+        return loads(repaired)
+    except json.JSONDecodeError:
+        raise ValueError(f"Failed to parse LLM response as JSON: {error}") from error
+
+
+def repair_json(text: str) -> str:
+    """Best-effort syntactic repair of a damaged JSON document."""
+    fence = re.search(r"```(?:json)?\s*(.*?)(?:```|$)", text, re.DOTALL)
+    if fence:
+        text = fence.group(1)
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=0)
+    text = text[start:]
+
+    out: list[str] = []
+    # Stack entries: [closer, expecting_key]
+    stack: list[list[Any]] = []
+    # (length of out, closers) where the document could be cut and closed
+    safe: tuple[int, list[str]] = (0, [])
+    in_string = False
+    escape = False
+    in_scalar = False
+
+    def mark_safe() -> None:
+        nonlocal safe
+        safe = (len(out), [frame[0] for frame in stack])
+
+    for c in text:
+        if in_string:
+            out.append(c)
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+                if stack and stack[-1][0] == "}" and stack[-1][1]:
+                    stack[-1][1] = False
+                else:
+                    mark_safe()
+            continue
+
+        if in_scalar and (c in ",}]" or c.isspace()):
+            in_scalar = False
+            mark_safe()
+
+        if c == '"':
+            in_string = True
+            out.append(c)
+        elif c in "{[":
+            out.append(c)
+            stack.append(["}" if c == "{" else "]", c == "{"])
+            mark_safe()
+        elif c in "}]":
+            _strip_trailing_comma(out)
+            if not stack or stack[-1][0] != c:
+                break
+            stack.pop()
+            out.append(c)
+            mark_safe()
+            if not stack:
+                break
+        elif c == ",":
+            out.append(c)
+            if stack and stack[-1][0] == "}":
+                stack[-1][1] = True
+        elif c == ":":
+            out.append(c)
+        elif c.isspace():
+            out.append(c)
+        else:
+            in_scalar = True
+            out.append(c)
+
+    if stack:
+        # Truncated: cut back to the last complete value and close up
+        length, closers = safe
+        del out[length:]
+        _strip_trailing_comma(out)
+        _strip_dangling_key(out)
+        out.extend(reversed(closers))
+
+    return "".join(out)
+
+
+def _strip_trailing_comma(out: list[str]) -> None:
+    """Remove a trailing comma (and whitespace) from the output buffer."""
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _strip_dangling_key(out: list[str]) -> None:
+    """Remove an object key left without a value by truncation."""
+    text = "".join(out)
+    match = re.search(r',?\s*"(?:[^"\\]|\\.)*"\s*:\s*$', text)
+    if match:
+        del out[match.start():]
+
+
+def coerce_number(value: Any) -> Any:
+    """
+    Convert a currency-like string such as "$1,200.00" or "(50)" to a float.
+
+    Only a single amount is accepted. Rates such as "8%", ranges, text and
+    strings with several numbers are returned unchanged so that validation
+    reports them.
+    """
+    if isinstance(value, bool) or not isinstance(value, str):
+        return value
+    match = AMOUNT_PATTERN.fullmatch(value.strip())
+    if match is None or bool(match["open"]) != bool(match["close"]):
+        return value
+    if match["sign"] and match["sign2"]:
+        return value
+    number = float(match["number"].replace(",", ""))
+    negative = match["open"] or match["sign"] or match["sign2"]
+    return -number if negative else number
+
+
+def coerce_category(value: Any) -> str:
+    """Map a free-form category onto one of the allowed categories."""
+    if not isinstance(value, str):
+        return "other"
+    key = value.strip().lower()
+    if key in CATEGORIES:
+        return key
+    return CATEGORY_ALIASES.get(key, "other")
+
+
+def infer_category(description: Any) -> str:
+    """Guess a category from a line item's description, e.g. "Permit fees" -> permits."""
+    if not isinstance(description, str):
+        return "other"
+    words = re.findall(r"[a-z]+", description.lower())
+    phrases = [" ".join(pair) for pair in zip(words, words[1:])] + words
+    for phrase in phrases:
+        category = coerce_category(phrase)
+        if category != "other":
+            return category
+        if phrase.endswith("s") and coerce_category(phrase[:-1]) != "other":
+            return coerce_category(phrase[:-1])
+    return "other"
+
+
+def coerce_line_item(item: Any) -> dict | None:
+    """Coerce a raw line item dict, or return None if it can't be salvaged."""
+    if not isinstance(item, dict):
+        return None
+    item = dict(item)
+    for key in ("quantity", "unit_price", "total"):
+        if key in item:
+            item[key] = coerce_number(item[key])
+    item["category"] = coerce_category(item.get("category"))
+
+    total = item.get("total")
+    quantity, unit_price = item.get("quantity"), item.get("unit_price")
+    if total is None and is_number(quantity) and is_number(unit_price):
+        item["total"] = quantity * unit_price
+
+    if not item.get("description") or not is_number(item.get("total")):
+        return None
+    return item
+
+
+def coerce_parsed_quote(data: Any) -> Any:
+    """Coerce raw parse output towards the ParsedQuote schema."""
+    if not isinstance(data, dict):
+        return data
+    data = dict(data)
+    for key in ("subtotal", "tax", "total"):
+        if key in data:
+            data[key] = coerce_number(data[key])
+
+    raw_items = data.get("line_items")
+    if isinstance(raw_items, list):
+        data["line_items"] = [
+            item for item in map(coerce_line_item, raw_items) if item is not None
+        ]
+    # Document totals are never derived from the line items: after a
+    # truncated response those would be the totals of a fragment
+    return data
+
+
+def coerce_hidden_cost(item: Any) -> dict | None:
+    """Coerce a raw hidden cost dict, or return None if it can't be salvaged."""
+    if not isinstance(item, dict):
+        return None
+    item = dict(item)
+    item["estimated_amount"] = coerce_number(item.get("estimated_amount"))
+    item.setdefault("reason", "")
+    if not item.get("vendor") or not item.get("item"):
+        return None
+    if not is_number(item["estimated_amount"]):
+        return None
+    return item
+
+
+def coerce_ranked_quote(item: Any) -> Any:
+    """Coerce a raw ranked quote dict towards the RankedQuote schema."""
+    if not isinstance(item, dict):
+        return item
+    item = dict(item)
+    for key in ("base_price", "true_total", "score"):
+        if key in item:
+            item[key] = coerce_number(item[key])
+    if is_number(item.get("score")):
+        item["score"] = min(max(item["score"], 0), 100)
+    if item.get("true_total") is None and is_number(item.get("base_price")):
+        item["true_total"] = item["base_price"]
+    for key in ("pros", "cons"):
+        if item.get(key) is None:
+            item[key] = []
+    return item
+
+
+def coerce_analysis(data: Any) -> Any:
+    """Coerce raw analysis output towards the QuoteAnalysis schema."""
+    if not isinstance(data, dict):
+        return data
+    data = dict(data)
+    for key in ("normalized_categories", "hidden_costs", "caveats"):
+        if data.get(key) is None:
+            data[key] = []
+
+    if isinstance(data["hidden_costs"], list):
+        data["hidden_costs"] = [
+            item for item in map(coerce_hidden_cost, data["hidden_costs"])
+            if item is not None
+        ]
+    if isinstance(data.get("ranking"), list):
+        data["ranking"] = [coerce_ranked_quote(item) for item in data["ranking"]]
+
+    data["confidence"] = coerce_confidence(data.get("confidence"))
+    return data
+
+
+def coerce_confidence(value: Any) -> Any:
+    """
+    Coerce a 0.0-1.0 confidence to a float, accepting percentages and
+    numeric strings. Booleans become None (validation would read True as
+    1.0) and anything else is returned unchanged; check the result with
+    is_number.
+    """
+    if isinstance(value, bool):
+        return None
+    percent = isinstance(value, str) and value.strip().endswith("%")
+    if percent:
+        value = value.strip()[:-1]
+    confidence = coerce_number(value)
+    if not is_number(confidence):
+        return confidence
+    # Some models answer with a percentage; a little over 1.0 is just
+    # over-confidence
+    if percent or (
+        confidence > 1 and (isinstance(confidence, int) or confidence > PERCENT_CONFIDENCE)
+    ):
+        confidence = confidence / 100
+    return min(max(float(confidence), 0.0), 1.0)
+
+
+def check_totals(quote: ParsedQuote) -> bool:
+    """Whether line items, subtotal, tax and total are arithmetically consistent."""
+    for item in quote.line_items:
+        if item.quantity is not None and item.unit_price is not None:
+            if not amounts_close(item.quantity * item.unit_price, item.total):
+                return False
+    if not amounts_close(sum(item.total for item in quote.line_items), quote.subtotal):
+        return False
+    return amounts_close(quote.subtotal + (quote.tax or 0), quote.total)
+
+
+def amounts_close(a: float, b: float) -> bool:
+    """Whether two amounts agree to the cent."""
+    # The epsilon absorbs float error in sums of cents
+    return abs(a - b) <= CENT_TOLERANCE + 1e-6
+
+
+def retry_invalid_fields(
+    model: type[BaseModel],
+    data: dict,
+    error: ValidationError | None,
+    context: str,
+    llm_model: str | None = None,
+    problems: dict[str, str] | None = None,
+) -> dict:
+    """
+    Ask the LLM to regenerate only the top-level fields that failed validation.
+
+    Args:
+        model: The Pydantic model the data must validate against
+        data: The (coerced) data that failed validation
+        error: The validation error raised for ``data``, if any
+        context: Source material the fields should be derived from
+        llm_model: LLM to ask (defaults to get_model())
+        problems: Further fields to regenerate, with what is wrong with
+            each (e.g. a list that may have been cut off)
+
+    Returns:
+        ``data`` with the invalid fields replaced by the LLM's answer
+
+    Raises:
+        ValueError: If the retry response cannot be decoded
+    """
+    problems = problems or {}
+    details = error.errors() if error is not None else []
+    fields = sorted({str(err["loc"][0]) for err in details if err["loc"]} | problems.keys())
+    if not fields:
+        if error is not None:
+            raise error
+        return data
+
+    errors = "\n".join(
+        [f"- {'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in details]
+        + [f"- {field}: {problem}" for field, problem in problems.items()]
+    )
+    prompt = RETRY_PROMPT.format(
+        errors=errors,
+        data=dumps(data, indent=True),
+        context=context,
+        fields=", ".join(fields),
+        schema=schema_json(model),
+    )
+
+    patch = load_json("".join(stream_chat(prompt, llm_model)))
+    if not isinstance(patch, dict):
+        raise ValueError("Retry response was not a JSON object")
+    return {**data, **{key: patch[key] for key in fields if key in patch}}
+
+
+def is_number(value: Any) -> bool:
+    """Whether a value is an int or float (booleans don't count)."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -0,0 +1,285 @@
+"""Revision-aware parsing: reparse only the pages that changed.
+
+Each parsed quote is recorded with a fingerprint of every page and the
+page each line item came from. When a later document shares pages with a
+recorded revision, only its new or changed pages go to the LLM; their
+line items are patched into the earlier ParsedQuote and the totals are
+recomputed and checked.
+"""
+
+import hashlib
+import os
+import re
+from pathlib import Path
+
+from pydantic import BaseModel, Field, ValidationError
+
+from core.models import ParsedQuote, QuoteLineItem
+from core.parser import parse_pages
+from core.preprocess import page_bodies, preprocess_pages
+from core.repair import amounts_close, coerce_number
+from core.serialization import read_records, write_atomic
+from core.streaming import PartialCallback
+
+
+# Revisions kept per vendor
+MAX_REVISIONS = 5
+
+MONEY_PATTERN = re.compile(r"\$?\s?\d[\d,]*(?:\.\d+)?")
+
+
+class RevisionRecord(BaseModel):
+    """A parsed quote with per-page fingerprints."""
+    vendor_name: str
+    page_hashes: list[str]
+    item_pages: list[int] = Field(description="1-based page of each line item")
+    quote: ParsedQuote
+
+
+class RevisionReport(BaseModel):
+    """What changed between a quote and its earlier revision."""
+    vendor_name: str
+    changed_pages: list[int]
+    removed_items: list[QuoteLineItem]
+    added_items: list[QuoteLineItem]
+    previous_total: float
+    total: float
+
+
+def revisions_enabled() -> bool:
+    """Whether revision-aware parsing is enabled (QUOTE_REVISIONS=on)."""
+    return os.getenv("QUOTE_REVISIONS", "off").lower() in ("on", "1", "true")
+
+
+def get_revision_dir() -> Path:
+    """Get the directory revisions are stored in from environment or default."""
+    return Path(os.getenv("QUOTE_REVISION_DIR", ".revisions"))
+
+
+def page_hash(text: str) -> str:
+    """Fingerprint a page's text, ignoring whitespace differences."""
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()[:16]
+
+
+def page_hashes(pages: list[str]) -> list[str]:
+    """Fingerprint each page, ignoring running headers and footers."""
+    return [page_hash(body) for body in page_bodies(pages)]
+
+
+def load_revisions() -> list[RevisionRecord]:
+    """Load every stored revision, skipping unreadable ones."""
+    records: list[RevisionRecord] = []
+    directory = get_revision_dir()
+    if not directory.is_dir():
+        return records
+    for path in sorted(directory.glob("*.json")):
+        for raw in read_records(path):
+            try:
+                records.append(RevisionRecord.model_validate(raw))
+            except ValidationError:
+                continue
+    return records
+
+
+def record_revision(
+    pages: list[str],
+    quote: ParsedQuote,
+    item_pages: list[int] | None = None,
+) -> None:
+    """
+    Store a parsed quote so later revisions can be diffed against it.
+
+    Args:
+        pages: Raw page text the quote was parsed from
+        quote: The parsed quote
+        item_pages: Page of each line item; located by amount if omitted
+    """
+    if not revisions_enabled():
+        return
+    if item_pages is None:
+        item_pages = locate_items(pages, quote)
+        if item_pages is None:
+            return
+
+    record = RevisionRecord(
+        vendor_name=quote.vendor_name,
+        page_hashes=page_hashes(pages),
+        item_pages=item_pages,
+        quote=quote,
+    )
+    directory = get_revision_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = "_".join(re.findall(r"[a-z0-9]+", quote.vendor_name.lower()))[:60] or "vendor"
+    path = directory / f"{slug}.json"
+    existing = [r for r in read_records(path) if r.get("page_hashes") != record.page_hashes]
+    write_atomic(path, (existing + [record.model_dump()])[-MAX_REVISIONS:])
+
+
+def find_previous(hashes: list[str], first_page: str) -> RevisionRecord | None:
+    """
+    The recorded revision of the same vendor sharing the most pages with a
+    document.
+
+    A record belongs to the vendor when its vendor name appears as whole
+    words on the document's first page; shared boilerplate pages alone
+    don't make it the same vendor's quote.
+    """
+    page = f" {_fingerprint(first_page)} "
+    best: tuple[int, RevisionRecord] | None = None
+    for record in load_revisions():
+        vendor = _fingerprint(record.vendor_name)
+        if not vendor or f" {vendor} " not in page:
+            continue
+        shared = len(set(hashes) & set(record.page_hashes))
+        if shared and (best is None or shared >= best[0]):
+            best = (shared, record)
+    return best[1] if best else None
+
+
+def parse_revision(
+    pages: list[str],
+    on_partial: PartialCallback | None = None,
+    drop_terms: bool = False,
+) -> tuple[ParsedQuote, list[int], RevisionReport] | None:
+    """
+    Parse a document as a revision of a recorded quote.
+
+    Only pages whose fingerprint isn't in the earlier revision are sent to
+    the LLM. Returns None when revisions are disabled, no earlier revision
+    shares a page, nothing changed enough to benefit, or the patched
+    totals don't check out; the caller then parses the whole document.
+
+    Pages are compared without their running headers and footers, so a
+    new revision number or date in a header doesn't count as a change.
+    ``drop_terms`` drops terms-and-conditions sections from the changed
+    pages, as for a full parse.
+
+    Returns:
+        The patched quote, the page of each line item, and a change report
+    """
+    if not revisions_enabled():
+        return None
+    hashes = page_hashes(pages)
+    previous = find_previous(hashes, pages[0])
+    if previous is None:
+        return None
+    if hashes == previous.page_hashes:
+        report = _report(previous, [], [], [], previous.quote)
+        return previous.quote, previous.item_pages, report
+
+    old_pages = {h: n for n, h in enumerate(previous.page_hashes, 1)}
+    changed = [n for n, h in enumerate(hashes, 1) if h not in old_pages]
+    if len(changed) == len(pages):
+        return None
+
+    cleaned = preprocess_pages([pages[n - 1] for n in changed], drop_terms).text.split("\n\n")
+    if len(cleaned) != len(changed):
+        # A changed page cleaned down to nothing; let the full parse handle it
+        return None
+    try:
+        new_items, fields = parse_pages(dict(zip(changed, cleaned)), on_partial)
+    except ValueError:
+        return None
+    for key in ("subtotal", "tax", "total"):
+        if key in fields and not isinstance(fields[key], (int, float)):
+            del fields[key]
+
+    items: list[QuoteLineItem] = []
+    item_pages: list[int] = []
+    for n, h in enumerate(hashes, 1):
+        if h in old_pages:
+            page_items = [
+                item for item, page in zip(previous.quote.line_items, previous.item_pages)
+                if page == old_pages[h]
+            ]
+        else:
+            page_items = new_items[n]
+        items.extend(page_items)
+        item_pages.extend([n] * len(page_items))
+
+    old = previous.quote
+    subtotal = round(sum(item.total for item in items), 2)
+    if "tax" in fields:
+        tax = fields["tax"]
+    elif old.tax is not None and old.subtotal:
+        # Keep the earlier effective tax rate
+        tax = round(old.tax / old.subtotal * subtotal, 2)
+    else:
+        tax = old.tax
+    total = round(subtotal + (tax or 0), 2)
+    # Totals on an unchanged page still hold, so the patched quote must
+    # reproduce the earlier ones
+    expected = {"subtotal": old.subtotal, "total": old.total, **fields}
+    for key, value in (("subtotal", subtotal), ("total", total)):
+        if expected[key] is not None and not amounts_close(expected[key], value):
+            return None
+
+    data = old.model_dump()
+    data.update({k: v for k, v in fields.items() if k not in ("subtotal", "tax", "total")})
+    data.update(
+        line_items=[item.model_dump() for item in items],
+        subtotal=subtotal,
+        tax=tax,
+        total=total,
+    )
+    try:
+        quote = ParsedQuote.model_validate(data)
+    except ValidationError:
+        return None
+
+    removed = _missing_from(old.line_items, quote.line_items)
+    added = _missing_from(quote.line_items, old.line_items)
+    return quote, item_pages, _report(previous, changed, removed, added, quote)
+
+
+def locate_items(pages: list[str], quote: ParsedQuote) -> list[int] | None:
+    """Find the page each line item's total appears on, in order."""
+    amounts = [
+        {coerce_number(m.group().replace(" ", "")) for m in MONEY_PATTERN.finditer(page)}
+        for page in pages
+    ]
+    located: list[int] = []
+    page = 0
+    for item in quote.line_items:
+        while page < len(pages) and not any(
+            isinstance(a, float) and abs(a - item.total) <= 0.01 for a in amounts[page]
+        ):
+            page += 1
+        if page == len(pages):
+            return None
+        located.append(page + 1)
+    return located
+
+
+def _missing_from(items: list[QuoteLineItem], others: list[QuoteLineItem]) -> list[QuoteLineItem]:
+    """Items in ``items`` with no equal counterpart in ``others``."""
+    remaining = [other.model_dump() for other in others]
+    missing: list[QuoteLineItem] = []
+    for item in items:
+        dumped = item.model_dump()
+        if dumped in remaining:
+            remaining.remove(dumped)
+        else:
+            missing.append(item)
+    return missing
+
+
+def _fingerprint(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _report(
+    previous: RevisionRecord,
+    changed: list[int],
+    removed: list[QuoteLineItem],
+    added: list[QuoteLineItem],
+    quote: ParsedQuote,
+) -> RevisionReport:
+    return RevisionReport(
+        vendor_name=quote.vendor_name,
+        changed_pages=changed,
+        removed_items=removed,
+        added_items=added,
+        previous_total=previous.quote.total,
+        total=quote.total,
+    )
@@ -0,0 +1,106 @@
+"""JSON encoding and decoding, backed by orjson when it is installed."""
+
+import json
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def loads(data: str | bytes) -> Any:
+    """
+    Decode JSON text.
+
+    Raises:
+        json.JSONDecodeError: If the text is not valid JSON (orjson's
+            error is a subclass, so callers can catch either)
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any, indent: bool = False) -> bytes:
+    """Encode an object as UTF-8 JSON bytes, optionally indented by two spaces."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """Encode an object as a JSON string, optionally indented by two spaces."""
+    return dumps_bytes(obj, indent).decode()
+
+
+def read_records(path: Path) -> list[dict]:
+    """
+    The objects in a JSON array file.
+
+    A missing, corrupt or partly written file has none, so a damaged
+    cache file never fails the request that reads it.
+    """
+    try:
+        data = loads(path.read_bytes())
+    except (OSError, ValueError):
+        return []
+    return [r for r in data if isinstance(r, dict)] if isinstance(data, list) else []
+
+
+def write_atomic(path: Path, obj: Any, indent: bool = False) -> None:
+    """
+    Write an object as JSON through a uniquely named temp file and a rename,
+    so readers never see a partial file and concurrent writers don't share
+    a temp file.
+    """
+    with tempfile.NamedTemporaryFile("wb", dir=path.parent, suffix=".tmp", delete=False) as tmp:
+        tmp.write(dumps_bytes(obj, indent))
+    os.replace(tmp.name, path)
+
+
+@lru_cache(maxsize=None)
+def schema_json(model: type[BaseModel], exclude: tuple[str, ...] = ()) -> str:
+    """
+    A model's JSON schema as indented text, computed once per model.
+
+    ``exclude`` leaves out top-level fields the LLM isn't meant to fill
+    in, along with any definitions only they used.
+    """
+    schema = model.model_json_schema()
+    if exclude:
+        schema["properties"] = {
+            name: field for name, field in schema["properties"].items() if name not in exclude
+        }
+        if "required" in schema:
+            schema["required"] = [name for name in schema["required"] if name not in exclude]
+        _drop_unused_defs(schema)
+    return dumps(schema, indent=True)
+
+
+def _drop_unused_defs(schema: dict) -> None:
+    """Remove $defs entries no longer referenced from the schema."""
+    defs = schema.pop("$defs", {})
+    used: set[str] = set()
+    pending: list[Any] = [schema]
+    while pending:
+        text = dumps(pending.pop())
+        for name, definition in defs.items():
+            if name not in used and f'"#/$defs/{name}"' in text:
+                used.add(name)
+                pending.append(definition)
+    if used:
+        schema["$defs"] = {name: defs[name] for name in defs if name in used}
+
+
+def dump_model(model: BaseModel, indent: bool = False, exclude: set[str] | None = None) -> bytes:
+    """Encode a Pydantic model as UTF-8 JSON bytes using its native serializer."""
+    return model.model_dump_json(indent=2 if indent else None, exclude=exclude).encode()
@@ -0,0 +1,237 @@
+"""Incremental JSON parsing for streamed LLM output."""
+
+from typing import Any, Callable, Iterable
+
+from core.repair import load_json
+from core.serialization import loads
+
+Path = tuple[str | int, ...]
+
+# Receives (kind, value) for each validated sub-object as soon as it is
+# complete, e.g. ("line_item", QuoteLineItem) or ("recommendation", str)
+PartialCallback = Callable[[str, Any], None]
+
+WHITESPACE = " \t\r\n"
+SCALAR_START = "-0123456789tfn"
+
+
+class MalformedJSONError(ValueError):
+    """Raised when streamed output can no longer be valid JSON."""
+
+
+class IncrementalJSONParser:
+    """
+    Parse a JSON document as it arrives in chunks.
+
+    Completed values whose path matches one of the watched patterns are
+    decoded and handed to ``on_value`` as soon as their closing token is
+    seen. A pattern is a tuple of keys, where ``"*"`` matches any array
+    index, e.g. ``("line_items", "*")`` or ``("recommendation",)``.
+
+    Structural errors raise MalformedJSONError immediately, so a caller
+    can abort a generation that has gone off the rails instead of waiting
+    for it. Trailing commas are tolerated since load_json repairs them,
+    and so is anything before the first "{" or "[" or after the document
+    ends (a markdown fence, leading prose or a closing remark).
+    """
+
+    def __init__(
+        self,
+        watch: set[Path] | None = None,
+        on_value: Callable[[Path, Any], None] | None = None,
+    ) -> None:
+        self._watch = watch or set()
+        self._on_value = on_value
+        self._buf = ""
+        self._pos = 0
+        # Each frame: [kind, key, state, start], kind is "{" or "["
+        self._stack: list[list[Any]] = []
+        self._done = False
+        self._string_start: int | None = None
+        self._escape = False
+        self._scalar_start: int | None = None
+        # Whether the document's opening bracket has been seen
+        self._started = False
+        # Where the document ended, once it has
+        self._end: int | None = None
+
+    def feed(self, chunk: str) -> None:
+        """Consume the next chunk of text, emitting any completed values."""
+        self._buf += chunk
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+        if not self._started:
+            # Skip a fence or prose; load_json strips them again on close
+            starts = [p for p in (buf.find("{", i), buf.find("[", i)) if p >= 0]
+            if not starts:
+                self._pos = n
+                return
+            i = min(starts)
+            self._started = True
+        while i < n:
+            c = buf[i]
+
+            if self._string_start is not None:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    start = self._string_start
+                    self._string_start = None
+                    self._end_string(start, i + 1)
+                i += 1
+                continue
+
+            if self._scalar_start is not None:
+                if c not in ",}]" and c not in WHITESPACE:
+                    i += 1
+                    continue
+                start = self._scalar_start
+                self._scalar_start = None
+                self._complete(start, i)
+                # Fall through: the terminator is handled below
+
+            if self._done:
+                # Ignore a closing fence or remark after the document
+                i = n
+                break
+            if c in WHITESPACE:
+                pass
+            elif c == '"':
+                if not (self._expecting_value() or self._expecting_key()):
+                    self._fail(i, "unexpected string")
+                self._string_start = i
+            elif c in "{[":
+                if not self._expecting_value():
+                    self._fail(i, f"unexpected '{c}'")
+                self._open_value()
+                self._stack.append([c, None if c == "{" else 0, "open", i])
+            elif c in "}]":
+                self._close(c, i)
+            elif c == ":":
+                frame = self._top()
+                if frame is None or frame[0] != "{" or frame[2] != "colon":
+                    self._fail(i, "unexpected ':'")
+                frame[2] = "value"
+            elif c == ",":
+                frame = self._top()
+                if frame is None or frame[2] != "comma":
+                    self._fail(i, "unexpected ','")
+                if frame[0] == "{":
+                    frame[2] = "key"
+                else:
+                    frame[1] += 1
+                    frame[2] = "value"
+            elif c in SCALAR_START and self._expecting_value():
+                self._open_value()
+                self._scalar_start = i
+            else:
+                self._fail(i, f"unexpected character {c!r}")
+            i += 1
+
+        self._pos = i
+
+    def feed_all(self, chunks: Iterable[str]) -> None:
+        """
+        Feed chunks until the document is complete.
+
+        Stops reading as soon as it is, so the caller can close the stream
+        instead of paying for (or failing on) a trailing remark.
+        """
+        for chunk in chunks:
+            self.feed(chunk)
+            if self._done:
+                return
+
+    @property
+    def text(self) -> str:
+        """All text fed so far."""
+        return self._buf
+
+    @property
+    def complete(self) -> bool:
+        """Whether the document's top-level value has been closed."""
+        return self._done
+
+    def close(self) -> Any:
+        """
+        Finish parsing and return the decoded document.
+
+        A document cut short (e.g. after an aborted stream) is repaired by
+        load_json, keeping every complete element that arrived.
+
+        Raises:
+            ValueError: If the document is empty or cannot be repaired
+        """
+        return load_json(self._buf[:self._end] if self._end is not None else self._buf)
+
+    def _top(self) -> list[Any] | None:
+        return self._stack[-1] if self._stack else None
+
+    def _expecting_value(self) -> bool:
+        frame = self._top()
+        if frame is None:
+            return not self._done
+        if frame[0] == "[":
+            return frame[2] in ("open", "value")
+        return frame[2] == "value"
+
+    def _expecting_key(self) -> bool:
+        frame = self._top()
+        return frame is not None and frame[0] == "{" and frame[2] in ("open", "key")
+
+    def _open_value(self) -> None:
+        frame = self._top()
+        if frame is not None and frame[0] == "[":
+            frame[2] = "value"
+
+    def _end_string(self, start: int, end: int) -> None:
+        frame = self._top()
+        if frame is not None and frame[0] == "{" and frame[2] in ("open", "key"):
+            frame[1] = loads(self._buf[start:end])
+            frame[2] = "colon"
+            return
+        self._open_value()
+        self._complete(start, end)
+
+    def _close(self, c: str, i: int) -> None:
+        frame = self._top()
+        opener = "{" if c == "}" else "["
+        # Expecting another key/element here means a trailing comma, which
+        # load_json repairs, so let it through
+        trailing = "key" if opener == "{" else "value"
+        if frame is None or frame[0] != opener or frame[2] not in ("open", "comma", trailing):
+            self._fail(i, f"unexpected '{c}'")
+        self._stack.pop()
+        self._complete(frame[3], i + 1)
+
+    def _complete(self, start: int, end: int) -> None:
+        path = tuple(frame[1] for frame in self._stack)
+        frame = self._top()
+        if frame is None:
+            self._done = True
+            self._end = end
+        else:
+            frame[2] = "comma"
+
+        if self._on_value is not None and self._matches(path):
+            try:
+                value = load_json(self._buf[start:end])
+            except ValueError:
+                # Left for the final repair pass rather than failing the stream
+                return
+            self._on_value(path, value)
+
+    def _matches(self, path: Path) -> bool:
+        for pattern in self._watch:
+            if len(pattern) == len(path) and all(
+                p == "*" and isinstance(k, int) or p == k
+                for p, k in zip(pattern, path)
+            ):
+                return True
+        return False
+
+    def _fail(self, i: int, message: str) -> None:
+        raise MalformedJSONError(f"Malformed JSON from LLM at char {i}: {message}")
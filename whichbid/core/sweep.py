@@ -0,0 +1,461 @@
+"""Criteria sensitivity sweep: score quotes under many criteria variants locally.
+
+Each vendor's quote is reduced once to a small set of features (true
+total, timeline, warranty, deposit, scope coverage). A criteria variant
+is then just a weight vector over those features plus budget and
+must-include penalties, so scoring every vendor under every variant is
+a handful of multiply-adds and no LLM calls. The weighting follows the
+rules the analysis prompt gives the LLM (priority order, heavy penalties
+for missing required items and for exceeding the budget).
+"""
+
+import itertools
+import re
+import statistics
+
+from core.models import (
+    ComparisonCriteria,
+    CriteriaGrid,
+    ParsedQuote,
+    SweepResult,
+    VariantResult,
+    VendorStability,
+    WinnerFlip,
+)
+
+
+# Priority wording -> feature it is scored by
+PRIORITY_FEATURES = {
+    "price": "price",
+    "cost": "price",
+    "budget": "price",
+    "value": "price",
+    "total": "price",
+    "timeline": "timeline",
+    "schedule": "timeline",
+    "speed": "timeline",
+    "time": "timeline",
+    "delivery": "timeline",
+    "deadline": "timeline",
+    "warranty": "warranty",
+    "guarantee": "warranty",
+    "payment": "payment",
+    "deposit": "payment",
+    "terms": "payment",
+    "scope": "scope",
+    "completeness": "scope",
+    "coverage": "scope",
+}
+
+# Categories that say too little to count as missing scope
+IGNORED_CATEGORIES = {"other"}
+
+# Score deducted per missing must-include item
+MISSING_ITEM_PENALTY = 15.0
+# Score deducted for exceeding the budget, plus a share of the overrun
+OVER_BUDGET_PENALTY = 20.0
+MAX_OVER_BUDGET_PENALTY = 50.0
+
+# Neutral value for a feature a quote doesn't state
+UNKNOWN = 0.5
+
+# Most criteria variants one sweep may expand to (7 permuted priorities
+# with a single budget and must-include list fit)
+MAX_VARIANTS = 10_000
+
+DURATION_PATTERN = re.compile(
+    r"(\d+(?:\.\d+)?)(?:\s*(?:-|to)\s*(\d+(?:\.\d+)?))?\s*(business\s+|working\s+)?"
+    r"(day|week|month|year)s?",
+    re.IGNORECASE,
+)
+UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
+WARRANTY_PATTERN = re.compile(
+    r"(\d+(?:\.\d+)?)[\s-]*(year|yr|month|mo)s?\b[^.;\n]{0,40}?(?:warrant|guarantee)"
+    r"|(?:warrant|guarantee)[^.;\n]{0,40}?(\d+(?:\.\d+)?)[\s-]*(year|yr|month|mo)s?\b",
+    re.IGNORECASE,
+)
+DEPOSIT_PATTERN = re.compile(
+    r"(\d+(?:\.\d+)?)\s*%\s*(?:deposit|down|upfront|up front|up-front|at signing|advance)"
+    r"|(?:deposit|down payment|upfront|advance)[^.;\n]{0,30}?(\d+(?:\.\d+)?)\s*%",
+    re.IGNORECASE,
+)
+
+
+class QuoteFeatures:
+    """Per-vendor feature columns, computed once and shared by every variant."""
+
+    def __init__(self, quotes: list[ParsedQuote]) -> None:
+        self.vendors = _unique_names([q.vendor_name for q in quotes])
+        self.texts = [_quote_text(q) for q in quotes]
+        true_totals = _true_totals(quotes)
+        # Budgets and ties fall back to the quoted total where the true
+        # total is unknown
+        self.true_totals = [
+            total if total is not None else q.total for total, q in zip(true_totals, quotes)
+        ]
+        self.columns: dict[str, list[float]] = {
+            "price": _inverse_scaled(true_totals),
+            "timeline": _inverse_scaled([_timeline_days(q.timeline) for q in quotes]),
+            "warranty": _scaled([_warranty_months(t) for t in self.texts]),
+            "payment": [_deposit_score(t) for t in self.texts],
+            "scope": _scope_coverage(quotes),
+        }
+        self._includes: dict[str, list[bool]] = {}
+        self._over_budget: dict[float, list[float]] = {}
+
+    def includes(self, item: str) -> list[bool]:
+        """Whether each quote mentions a required item."""
+        key = item.strip().lower()
+        if key not in self._includes:
+            words = [w.rstrip("s") for w in re.findall(r"[a-z0-9]+", key)]
+            self._includes[key] = [all(w in text for w in words) for text in self.texts]
+        return self._includes[key]
+
+    def budget_penalties(self, budget: float) -> list[float]:
+        """Score deducted from each quote for exceeding a budget."""
+        if budget not in self._over_budget:
+            self._over_budget[budget] = [
+                min(MAX_OVER_BUDGET_PENALTY, OVER_BUDGET_PENALTY + 100 * (total - budget) / budget)
+                if budget > 0 and total > budget else 0.0
+                for total in self.true_totals
+            ]
+        return self._over_budget[budget]
+
+
+def priority_weights(priorities: list[str]) -> tuple[dict[str, float], list[str]]:
+    """
+    Weight features by priority order (first priority weighs most).
+
+    Returns:
+        Feature weights summing to 1, and the priorities no feature measures
+    """
+    weights: dict[str, float] = {}
+    unscored: list[str] = []
+    n = len(priorities)
+    for rank, priority in enumerate(priorities):
+        feature = _priority_feature(priority)
+        if feature is None:
+            unscored.append(priority)
+        elif feature not in weights:
+            weights[feature] = float(n - rank)
+    if not weights:
+        weights = {"price": 1.0}
+    total = sum(weights.values())
+    return {f: w / total for f, w in weights.items()}, unscored
+
+
+def score_variant(features: QuoteFeatures, criteria: ComparisonCriteria) -> tuple[list[float], list[str]]:
+    """
+    Score every quote under one criteria variant.
+
+    Returns:
+        A 0-100 score per quote, and the priorities that couldn't be scored
+    """
+    weights, unscored = priority_weights(criteria.priorities)
+    scores = [0.0] * len(features.vendors)
+    for feature, weight in weights.items():
+        column = features.columns[feature]
+        for i, value in enumerate(column):
+            scores[i] += 100 * weight * value
+    for item in criteria.must_include or []:
+        for i, present in enumerate(features.includes(item)):
+            if not present:
+                scores[i] -= MISSING_ITEM_PENALTY
+    if criteria.budget_limit is not None:
+        for i, penalty in enumerate(features.budget_penalties(criteria.budget_limit)):
+            scores[i] -= penalty
+    return [round(min(100.0, max(0.0, s)), 1) for s in scores], unscored
+
+
+def expand_grid(base: ComparisonCriteria, grid: CriteriaGrid) -> list[ComparisonCriteria]:
+    """
+    List the criteria variants a grid describes, base criteria first.
+
+    Every combination of the per-field alternatives is produced (fields
+    without alternatives keep their base value), followed by the explicit
+    variants. Duplicates are dropped.
+
+    Raises:
+        ValueError: If the grid describes more than MAX_VARIANTS variants
+            (checked before anything is expanded)
+    """
+    count = count_variants(base, grid)
+    if count > MAX_VARIANTS:
+        raise ValueError(
+            f"Sweep grid describes more than {MAX_VARIANTS} criteria variants; "
+            "use fewer priorities to permute or fewer alternatives"
+        )
+
+    orders = list(grid.priorities or [])
+    if grid.permute_priorities:
+        orders += [list(p) for p in itertools.permutations(base.priorities)]
+    orders = orders or [base.priorities]
+    budgets = grid.budget_limit if grid.budget_limit is not None else [base.budget_limit]
+    includes = grid.must_include if grid.must_include is not None else [base.must_include]
+
+    variants = [base]
+    for priorities, budget, must_include in itertools.product(orders, budgets, includes):
+        variants.append(base.model_copy(update={
+            "priorities": priorities,
+            "budget_limit": budget,
+            "must_include": must_include,
+        }))
+    variants.extend(grid.variants)
+
+    unique: list[ComparisonCriteria] = []
+    seen: set[str] = set()
+    for variant in variants:
+        key = variant.model_dump_json()
+        if key not in seen:
+            seen.add(key)
+            unique.append(variant)
+    return unique
+
+
+def count_variants(base: ComparisonCriteria, grid: CriteriaGrid) -> int:
+    """
+    How many variants a grid describes before duplicates are dropped.
+
+    Stops counting permutations once past MAX_VARIANTS, so a long
+    priority list doesn't make the count itself expensive.
+    """
+    orders = len(grid.priorities or [])
+    if grid.permute_priorities:
+        permutations = 1
+        for n in range(2, len(base.priorities) + 1):
+            permutations *= n
+            if permutations > MAX_VARIANTS:
+                break
+        orders += permutations
+    budgets = len(grid.budget_limit) if grid.budget_limit is not None else 1
+    includes = len(grid.must_include) if grid.must_include is not None else 1
+    return 1 + max(orders, 1) * budgets * includes + len(grid.variants)
+
+
+def sweep_criteria(quotes: list[ParsedQuote], variants: list[ComparisonCriteria]) -> SweepResult:
+    """
+    Score quotes under every criteria variant without calling the LLM.
+
+    Args:
+        quotes: Parsed quotes to compare
+        variants: Criteria variants; the first is the base the others are
+            compared against
+
+    Returns:
+        SweepResult with per-variant scores and rankings, winner flips and
+        ranking stability
+
+    Raises:
+        ValueError: If there are no quotes or no variants
+    """
+    if not quotes:
+        raise ValueError("At least one quote is required for a sweep")
+    if not variants:
+        raise ValueError("At least one criteria variant is required for a sweep")
+
+    features = QuoteFeatures(quotes)
+    vendors = features.vendors
+    results: list[VariantResult] = []
+    unscored: list[str] = []
+    for index, criteria in enumerate(variants):
+        scores, missing = score_variant(features, criteria)
+        unscored.extend(p for p in missing if p not in unscored)
+        # Ties go to the cheaper quote
+        order = sorted(
+            range(len(vendors)),
+            key=lambda i: (-scores[i], features.true_totals[i], vendors[i]),
+        )
+        ranking = [vendors[i] for i in order]
+        results.append(VariantResult(
+            index=index,
+            criteria=criteria,
+            scores=dict(zip(vendors, scores)),
+            ranking=ranking,
+            winner=ranking[0],
+            rank_agreement=_kendall_tau(results[0].ranking if results else ranking, ranking),
+        ))
+
+    base = results[0]
+    flips = [
+        WinnerFlip(
+            variant=r.index,
+            changes=describe_changes(base.criteria, r.criteria),
+            winner=r.winner,
+            base_winner=base.winner,
+        )
+        for r in results[1:]
+        if r.winner != base.winner
+    ]
+    stability = [
+        VendorStability(
+            vendor=vendor,
+            wins=sum(1 for r in results if r.winner == vendor),
+            best_rank=min(r.ranking.index(vendor) for r in results) + 1,
+            worst_rank=max(r.ranking.index(vendor) for r in results) + 1,
+            mean_score=round(statistics.fmean(r.scores[vendor] for r in results), 1),
+        )
+        for vendor in vendors
+    ]
+    stability.sort(key=lambda s: (-s.wins, -s.mean_score))
+
+    return SweepResult(
+        vendors=vendors,
+        variants=results,
+        stability=round(sum(1 for r in results if r.winner == base.winner) / len(results), 3),
+        rank_agreement=round(statistics.fmean(r.rank_agreement for r in results), 3),
+        vendor_stability=stability,
+        flips=flips,
+        unscored_priorities=unscored,
+    )
+
+
+def describe_changes(base: ComparisonCriteria, variant: ComparisonCriteria) -> list[str]:
+    """Human-readable differences between two criteria."""
+    changes: list[str] = []
+    if variant.priorities != base.priorities:
+        changes.append(f"priorities: {', '.join(base.priorities)} -> {', '.join(variant.priorities)}")
+    if variant.budget_limit != base.budget_limit:
+        changes.append(f"budget: {_money(base.budget_limit)} -> {_money(variant.budget_limit)}")
+    if variant.must_include != base.must_include:
+        before = ", ".join(base.must_include or []) or "none"
+        after = ", ".join(variant.must_include or []) or "none"
+        changes.append(f"must include: {before} -> {after}")
+    if variant.notes != base.notes:
+        changes.append("notes changed")
+    return changes
+
+
+def _priority_feature(priority: str) -> str | None:
+    words = re.findall(r"[a-z]+", priority.lower())
+    for word in words:
+        if word in PRIORITY_FEATURES:
+            return PRIORITY_FEATURES[word]
+    return None
+
+
+def _unique_names(names: list[str]) -> list[str]:
+    """Vendor names, numbered where two quotes share one."""
+    counts: dict[str, int] = {}
+    unique: list[str] = []
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+        unique.append(name if counts[name] == 1 else f"{name} ({counts[name]})")
+    return unique
+
+
+def _quote_text(quote: ParsedQuote) -> str:
+    parts = [quote.notes, quote.payment_terms, quote.timeline]
+    for item in quote.line_items:
+        parts.extend([item.description, item.category])
+    return " ".join(p for p in parts if p).lower()
+
+
+def _category_totals(quote: ParsedQuote) -> dict[str, float]:
+    totals: dict[str, float] = {}
+    for item in quote.line_items:
+        category = item.category.lower()
+        if category not in IGNORED_CATEGORIES:
+            totals[category] = totals.get(category, 0.0) + item.total
+    return totals
+
+
+def _true_totals(quotes: list[ParsedQuote]) -> list[float | None]:
+    """
+    Quoted totals plus the typical cost of categories a quote leaves out.
+
+    A quote with no categorised items (e.g. a spreadsheet without a
+    category column) can't be checked for missing categories, so its true
+    total is unknown (None) rather than charged for all of them.
+    """
+    per_quote = [_category_totals(q) for q in quotes]
+    categories = set().union(*per_quote)
+    true_totals: list[float | None] = []
+    for quote, totals in zip(quotes, per_quote):
+        if categories and not totals:
+            true_totals.append(None)
+            continue
+        hidden = 0.0
+        for category in categories - totals.keys():
+            others = [t[category] for t in per_quote if category in t]
+            hidden += statistics.median(others)
+        true_totals.append(quote.total + hidden)
+    return true_totals
+
+
+def _scope_coverage(quotes: list[ParsedQuote]) -> list[float]:
+    per_quote = [set(_category_totals(q)) for q in quotes]
+    categories = set().union(*per_quote)
+    if not categories:
+        return [UNKNOWN] * len(quotes)
+    # Quotes without categorised items have unknown scope
+    return [len(c) / len(categories) if c else UNKNOWN for c in per_quote]
+
+
+def _timeline_days(timeline: str | None) -> float | None:
+    if not timeline:
+        return None
+    match = DURATION_PATTERN.search(timeline)
+    if match is None:
+        return None
+    amount = float(match.group(2) or match.group(1))
+    days = amount * UNIT_DAYS[match.group(4).lower()]
+    if match.group(3):
+        # Business days to calendar days
+        days *= 7 / 5
+    return days
+
+
+def _warranty_months(text: str) -> float | None:
+    best: float | None = None
+    for match in WARRANTY_PATTERN.finditer(text):
+        amount = float(match.group(1) or match.group(3))
+        unit = (match.group(2) or match.group(4)).lower()
+        months = amount * 12 if unit in ("year", "yr") else amount
+        best = months if best is None else max(best, months)
+    return best
+
+
+def _deposit_score(text: str) -> float:
+    """Lower upfront payment scores higher."""
+    match = DEPOSIT_PATTERN.search(text)
+    if match is None:
+        return UNKNOWN
+    percent = float(match.group(1) or match.group(2))
+    return max(0.0, 1 - percent / 100)
+
+
+def _inverse_scaled(values: list[float | None]) -> list[float]:
+    """Lower is better: the best known value scores 1, unknowns are neutral."""
+    known = [v for v in values if v is not None and v > 0]
+    if not known:
+        return [UNKNOWN] * len(values)
+    best = min(known)
+    return [best / v if v is not None and v > 0 else UNKNOWN for v in values]
+
+
+def _scaled(values: list[float | None]) -> list[float]:
+    """Higher is better: the best known value scores 1, unknowns score 0."""
+    known = [v for v in values if v is not None and v > 0]
+    if not known:
+        return [UNKNOWN] * len(values)
+    best = max(known)
+    return [v / best if v is not None and v > 0 else 0.0 for v in values]
+
+
+def _kendall_tau(a: list[str], b: list[str]) -> float:
+    """Rank correlation of two orderings of the same items (1 = identical)."""
+    n = len(a)
+    if n < 2:
+        return 1.0
+    position = {v: i for i, v in enumerate(b)}
+    ranks = [position[v] for v in a]
+    concordant = sum(
+        1 if ranks[i] < ranks[j] else -1
+        for i in range(n)
+        for j in range(i + 1, n)
+    )
+    return round(concordant / (n * (n - 1) / 2), 3)
+
+
+def _money(value: float | None) -> str:
+    return "none" if value is None else f"${value:,.2f}"
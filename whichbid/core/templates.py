@@ -0,0 +1,437 @@
+"""Per-vendor layout templates learned from LLM parses.
+
+After a successful LLM parse, learn_template records where each field and
+the line-item table sit in the (preprocessed) text, as anchor labels
+relative to lines. Later documents from the same vendor with the same
+layout are parsed locally by parse_with_template and accepted only if
+the totals add up; anything else goes back to the LLM.
+"""
+
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from pydantic import BaseModel, ValidationError
+
+from core.models import ParsedQuote
+from core.repair import (
+    amounts_close,
+    check_totals,
+    coerce_category,
+    coerce_number,
+    coerce_parsed_quote,
+)
+from core.serialization import read_records, write_atomic
+
+
+STRING_FIELDS = ("quote_date", "valid_until", "payment_terms", "timeline", "notes")
+AMOUNT_FIELDS = ("subtotal", "tax", "total")
+DATE_FIELDS = ("quote_date", "valid_until")
+DATE_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%m/%d/%Y", "%Y-%m-%d", "%d %B %Y", "%B %d %Y")
+
+NUMBER_TOKEN = re.compile(r"^\(?-?\$?(?:\d{1,3}(?:,\d{3})+|\d+)?(?:\.\d+)?\)?%?$")
+
+# Stands in for digit runs in stored labels, so "Tax (8.25%):" matches any rate
+DIGITS_MASK = "<n>"
+
+# Lines at the top of a document searched for the vendor's name line
+FINGERPRINT_LINES = 10
+
+# A "Label:" line or heading, which ends a multi-line string field
+LABEL_LINE = re.compile(r"^[A-Za-z][A-Za-z#&/()' .-]{0,30}:")
+
+
+class FieldAnchor(BaseModel):
+    """
+    Where a field's value sits: after ``label`` (digits masked).
+
+    Text fields other than dates run on until the next anchor, label,
+    heading or blank line, however many lines that takes.
+    """
+    label: str
+    # The value starts on the line after the label (a heading)
+    next_line: bool = False
+
+
+class VendorTemplate(BaseModel):
+    """Learned layout of one vendor's quotes."""
+    vendor_name: str
+    fingerprint: str
+    signature: str
+    header: str
+    numeric_fields: list[str | None]
+    has_category: bool
+    categories: dict[str, str]
+    fields: dict[str, FieldAnchor]
+
+
+def templates_enabled() -> bool:
+    """Whether vendor templates are enabled (VENDOR_TEMPLATES=on)."""
+    return os.getenv("VENDOR_TEMPLATES", "off").lower() in ("on", "1", "true")
+
+
+def get_template_dir() -> Path:
+    """Get the directory templates are stored in from environment or default."""
+    return Path(os.getenv("VENDOR_TEMPLATE_DIR", ".templates"))
+
+
+def load_templates() -> list[VendorTemplate]:
+    """Load every stored template."""
+    templates: list[VendorTemplate] = []
+    directory = get_template_dir()
+    if not directory.is_dir():
+        return templates
+    for path in sorted(directory.glob("*.json")):
+        for raw in read_records(path):
+            try:
+                templates.append(VendorTemplate.model_validate(raw))
+            except ValidationError:
+                continue
+    return templates
+
+
+def save_template(template: VendorTemplate) -> None:
+    """Store a template, replacing any with the same vendor and signature."""
+    directory = get_template_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{template.fingerprint.replace(' ', '_')[:60]}.json"
+    existing = [t for t in read_records(path) if t.get("signature") != template.signature]
+    write_atomic(path, existing + [template.model_dump()], indent=True)
+
+
+def parse_with_templates(text: str) -> ParsedQuote | None:
+    """
+    Parse text locally using a matching vendor template.
+
+    Returns:
+        The quote if a template matches and its totals check out,
+        otherwise None (including when templates are disabled)
+    """
+    if not templates_enabled():
+        return None
+    lines = text.splitlines()
+    top = {_fingerprint(line) for line in lines[:FINGERPRINT_LINES]}
+    for template in load_templates():
+        if template.fingerprint not in top:
+            continue
+        quote = parse_with_template(template, lines)
+        if quote is not None:
+            return quote
+    return None
+
+
+def learn_template(text: str, quote: ParsedQuote) -> VendorTemplate | None:
+    """
+    Learn and store a template from a text and its LLM parse.
+
+    Nothing is stored unless the parse is arithmetically consistent,
+    every field can be located in the text, and the template reproduces
+    the parse when applied back to the same text.
+    """
+    if not templates_enabled() or not check_totals(quote):
+        return None
+    template = build_template(text.splitlines(), quote)
+    if template is None:
+        return None
+    local = parse_with_template(template, text.splitlines())
+    if local is None or not _same_numbers(local, quote):
+        return None
+    save_template(template)
+    return template
+
+
+def build_template(lines: list[str], quote: ParsedQuote) -> VendorTemplate | None:
+    """Derive a template from lines of text and the quote parsed from them."""
+    # The vendor's name must sit on a line of its own near the top
+    fingerprint = _fingerprint(quote.vendor_name)
+    if not fingerprint or fingerprint not in {_fingerprint(line) for line in lines[:FINGERPRINT_LINES]}:
+        return None
+
+    # Locate each line item's row by its trailing amounts
+    rows: list[int] = []
+    start = 0
+    for item in quote.line_items:
+        for index in range(start, len(lines)):
+            numbers = _trailing_numbers(lines[index])
+            if numbers and amounts_close(numbers[-1], item.total):
+                rows.append(index)
+                start = index + 1
+                break
+        else:
+            return None
+    if not rows or rows[0] == 0:
+        return None
+
+    counts = {len(_trailing_numbers(lines[i])) for i in rows}
+    if len(counts) != 1:
+        return None
+    numeric_fields = _numeric_fields(
+        [_trailing_numbers(lines[i]) for i in rows], quote
+    )
+    if "total" not in numeric_fields:
+        return None
+
+    has_category = all(
+        _row_text(lines[i], len(numeric_fields))[1].lower() == item.category
+        for i, item in zip(rows, quote.line_items)
+    )
+    # Keyed by the whole description, as parse_with_template looks it up
+    categories = {
+        " ".join(_row_text(lines[i], len(numeric_fields))).strip().lower(): item.category
+        for i, item in zip(rows, quote.line_items)
+    }
+
+    fields: dict[str, FieldAnchor] = {}
+    table = set(range(rows[0] - 1, rows[-1] + 1))
+    for name in AMOUNT_FIELDS:
+        value = getattr(quote, name)
+        if value is None:
+            continue
+        anchor = _locate_amount(lines, value, table)
+        if anchor is None:
+            return None
+        fields[name] = anchor
+    for name in STRING_FIELDS:
+        value = getattr(quote, name)
+        if value is None:
+            continue
+        anchor = _locate_string(lines, name, value, table)
+        if anchor is None:
+            return None
+        fields[name] = anchor
+
+    header = _mask(lines[rows[0] - 1])
+    signature = hashlib.sha256(
+        json.dumps([header, sorted(a.label for a in fields.values())]).encode()
+    ).hexdigest()[:16]
+    return VendorTemplate(
+        vendor_name=quote.vendor_name,
+        fingerprint=fingerprint,
+        signature=signature,
+        header=header,
+        numeric_fields=numeric_fields,
+        has_category=has_category,
+        categories=categories,
+        fields=fields,
+    )
+
+
+def parse_with_template(template: VendorTemplate, lines: list[str]) -> ParsedQuote | None:
+    """Apply a template to lines of text, returning None if it doesn't fit."""
+    header_index = next(
+        (i for i, line in enumerate(lines) if _mask(line) == template.header), None
+    )
+    if header_index is None:
+        return None
+
+    anchors = {name: _anchor_regex(a.label) for name, a in template.fields.items()}
+    width = len(template.numeric_fields)
+
+    def ends_field(line: str) -> bool:
+        return _mask(line) == template.header or any(r.match(line) for r in anchors.values())
+
+    items: list[dict] = []
+    end = header_index + 1
+    for index in range(header_index + 1, len(lines)):
+        line = lines[index]
+        if any(regex.match(line) for regex in anchors.values()):
+            break
+        numbers = _trailing_numbers(line)
+        if not numbers:
+            # Wrapped description or table decoration
+            continue
+        if len(numbers) != width:
+            break
+        description, category = _row_text(line, width)
+        if not template.has_category:
+            description = f"{description} {category}".strip()
+            category = template.categories.get(description.lower(), "other")
+        item = {"description": description, "category": coerce_category(category)}
+        for field, value in zip(template.numeric_fields, numbers):
+            if field:
+                item[field] = value
+        items.append(item)
+        end = index + 1
+    if not items:
+        return None
+
+    data: dict = {"vendor_name": template.vendor_name, "line_items": items}
+    for name, anchor in template.fields.items():
+        if name in AMOUNT_FIELDS:
+            value = _extract(lines[end:], anchors[name], anchor)
+        elif name in DATE_FIELDS:
+            value = _extract(lines, anchors[name], anchor)
+        else:
+            value = _extract(lines, anchors[name], anchor, ends_field)
+        if value is None:
+            return None
+        if name in AMOUNT_FIELDS:
+            data[name] = _first_number(value)
+        elif name in DATE_FIELDS:
+            data[name] = _to_iso_date(value)
+        else:
+            data[name] = value
+
+    try:
+        quote = ParsedQuote.model_validate(coerce_parsed_quote(data))
+    except ValidationError:
+        return None
+    return quote if check_totals(quote) else None
+
+
+def _numeric_fields(rows: list[list[float]], quote: ParsedQuote) -> list[str | None]:
+    """Work out which trailing number column holds which line-item field."""
+    best: list[str | None] = []
+    for numbers, item in zip(rows, quote.line_items):
+        fields: list[str | None] = [None] * len(numbers)
+        for name in ("total", "unit_price", "quantity"):
+            value = getattr(item, name)
+            if value is None:
+                continue
+            positions = range(len(numbers) - 1, -1, -1) if name != "quantity" else range(len(numbers))
+            for j in positions:
+                if fields[j] is None and amounts_close(numbers[j], value):
+                    fields[j] = name
+                    break
+        if sum(f is not None for f in fields) > sum(f is not None for f in best):
+            best = fields
+    return best
+
+
+def _locate_amount(lines: list[str], value: float, table: set[int]) -> FieldAnchor | None:
+    """Find the label preceding an amount outside the line-item table."""
+    for index, line in enumerate(lines):
+        if index in table:
+            continue
+        numbers = _trailing_numbers(line)
+        if numbers and amounts_close(numbers[-1], value):
+            label = _strip_numbers(line)
+            if label:
+                return FieldAnchor(label=_mask(label))
+    return None
+
+
+def _locate_string(lines: list[str], name: str, value: str, table: set[int]) -> FieldAnchor | None:
+    """Find the label preceding a string field's value."""
+    target = " ".join(value.split()).lower()
+    probe = target[:24]
+    for index, line in enumerate(lines):
+        if index in table:
+            continue
+        if name in DATE_FIELDS:
+            for colon in re.finditer(":", line):
+                if _to_iso_date(line[colon.end():].strip()) == value:
+                    return FieldAnchor(label=_mask(line[:colon.end()]))
+        position = line.lower().find(probe)
+        if position < 0:
+            continue
+        if position > 0:
+            return FieldAnchor(label=_mask(line[:position].rstrip()))
+        if index > 0 and index - 1 not in table:
+            return FieldAnchor(label=_mask(lines[index - 1].strip()), next_line=True)
+    return None
+
+
+def _extract(
+    lines: list[str],
+    regex: re.Pattern,
+    anchor: FieldAnchor,
+    ends_field: Callable[[str], bool] | None = None,
+) -> str | None:
+    """
+    Read the value after an anchor.
+
+    With ``ends_field``, following lines are included until one matches
+    it or is a label, heading or blank line; otherwise the value is a
+    single line.
+    """
+    for index, line in enumerate(lines):
+        match = regex.match(line)
+        if not match:
+            continue
+        if anchor.next_line:
+            parts, rest = lines[index + 1:index + 2], index + 2
+        else:
+            parts, rest = [line[match.end():]], index + 1
+        if ends_field is not None:
+            for following in lines[rest:]:
+                if (
+                    not following.strip()
+                    or ends_field(following)
+                    or LABEL_LINE.match(following)
+                    or following.isupper()
+                ):
+                    break
+                parts.append(following)
+        value = " ".join(" ".join(parts).split()).lstrip(":").strip()
+        return value or None
+    return None
+
+
+def _row_text(line: str, width: int) -> tuple[str, str]:
+    """Split a row's text (without its trailing numbers) into description and last word."""
+    tokens = line.split()
+    text = tokens[:len(tokens) - width]
+    if len(text) > 1:
+        return " ".join(text[:-1]), text[-1]
+    return " ".join(text), ""
+
+
+def _trailing_numbers(line: str) -> list[float]:
+    numbers: list[float] = []
+    for token in reversed(line.split()):
+        if not NUMBER_TOKEN.match(token) or not re.search(r"\d", token):
+            break
+        value = coerce_number(token.rstrip("%"))
+        if not isinstance(value, float):
+            break
+        numbers.append(value)
+    return numbers[::-1]
+
+
+def _strip_numbers(line: str) -> str:
+    tokens = line.split()
+    count = len(_trailing_numbers(line))
+    return " ".join(tokens[:len(tokens) - count]).strip()
+
+
+def _first_number(text: str) -> float | None:
+    for token in text.split():
+        value = coerce_number(token)
+        if isinstance(value, float):
+            return value
+    return None
+
+
+def _to_iso_date(text: str) -> str:
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return text
+
+
+def _mask(text: str) -> str:
+    return re.sub(r"\d+", DIGITS_MASK, " ".join(text.split()))
+
+
+def _anchor_regex(label: str) -> re.Pattern:
+    pattern = r"\s+".join(re.escape(word) for word in label.split())
+    return re.compile("^" + pattern.replace(re.escape(DIGITS_MASK), r"\d+") + r"(?=\W|$)")
+
+
+def _fingerprint(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _same_numbers(a: ParsedQuote, b: ParsedQuote) -> bool:
+    return (
+        len(a.line_items) == len(b.line_items)
+        and all(amounts_close(x.total, y.total) for x, y in zip(a.line_items, b.line_items))
+        and amounts_close(a.total, b.total)
+    )
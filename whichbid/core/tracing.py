@@ -0,0 +1,189 @@
+"""Span tracing in Chrome trace-event format, plus an optional stack sampler.
+
+Code marks the work it does with ``span(...)``; spans are only recorded
+while a Tracer is active in the current context (see ``trace_to``), so
+they cost next to nothing otherwise. The resulting file opens in
+chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Iterator
+
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+_current: ContextVar["Tracer | None"] = ContextVar("tracer", default=None)
+
+
+class Tracer:
+    """Collects trace events for one run."""
+
+    def __init__(self) -> None:
+        self.events: list[dict] = []
+        self._start = time.perf_counter()
+        self._pid = os.getpid()
+        self._threads: dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        """Microseconds since the trace started."""
+        return (time.perf_counter() - self._start) * 1e6
+
+    def add(self, event: dict) -> None:
+        """Record an event on the calling thread."""
+        thread = threading.current_thread()
+        tid = thread.native_id or 0
+        with self._lock:
+            self._threads.setdefault(tid, thread.name)
+            self.events.append({"pid": self._pid, "tid": tid, **event})
+
+    def to_dict(self) -> dict:
+        """The trace as a Chrome trace-event JSON object."""
+        with self._lock:
+            names = [
+                {"ph": "M", "name": "thread_name", "pid": self._pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self._threads.items()
+            ]
+            return {"traceEvents": names + self.events, "displayTimeUnit": "ms"}
+
+    def write(self, path: str | Path) -> None:
+        """Write the trace to a JSON file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), default=str))
+
+
+def current_tracer() -> Tracer | None:
+    """The tracer active in this context, if any."""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, cat: str = "pipeline", **args: Any) -> Iterator[dict]:
+    """
+    Record a span around a block of work.
+
+    Yields the span's args dict, so the block can attach results such as
+    sizes or timings; they are written when the span closes.
+    """
+    tracer = _current.get()
+    if tracer is None:
+        yield args
+        return
+    start = tracer.now()
+    try:
+        yield args
+    finally:
+        tracer.add({
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round(start, 1),
+            "dur": round(tracer.now() - start, 1),
+            "args": args,
+        })
+
+
+def instant(name: str, cat: str = "pipeline", **args: Any) -> None:
+    """Record a point-in-time event, e.g. the first byte of a response."""
+    tracer = _current.get()
+    if tracer is not None:
+        tracer.add({"name": name, "cat": cat, "ph": "i", "s": "t", "ts": round(tracer.now(), 1), "args": args})
+
+
+@contextmanager
+def trace_to(path: str | Path | None) -> Iterator[Tracer | None]:
+    """
+    Trace everything run in this context and write it to ``path``.
+
+    The file is written even if the block raises. Does nothing when
+    ``path`` is None.
+    """
+    if path is None:
+        yield None
+        return
+    tracer = Tracer()
+    token = _current.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current.reset(token)
+        tracer.write(path)
+
+
+class Sampler:
+    """
+    Sample the Python stacks of running threads at a fixed interval.
+
+    Counts are kept per stack and written in the folded format
+    ("frame;frame;frame count" per line) that speedscope and
+    flamegraph.pl read.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start sampling in a background thread."""
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampler thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        """Sampled stacks in folded format, most frequent first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def write(self, path: str | Path) -> None:
+        """Write the sampled stacks to a folded-format file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.folded())
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack: list[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+@contextmanager
+def sample_to(path: str | Path | None, interval: float = SAMPLE_INTERVAL) -> Iterator[Sampler | None]:
+    """
+    Sample stacks while the block runs and write them to ``path``.
+
+    Does nothing when ``path`` is None.
+    """
+    if path is None:
+        yield None
+        return
+    sampler = Sampler(interval)
+    sampler.start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        sampler.write(path)
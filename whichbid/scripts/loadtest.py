@@ -0,0 +1,368 @@
+"""Load-test the /quotes/analyze endpoint against a stubbed LLM.
+
+Starts a stub OpenAI-compatible LLM server and the WhichBid API (unless
+--url points at one already running), replays random bid packages built
+from samples/*.pdf, and reports latency percentiles, throughput, error
+rate and server RSS.
+
+Usage:
+    python -m scripts.loadtest --concurrency 8 --duration 30
+    python -m scripts.loadtest --rate 5 --duration 60 --llm-latency 2
+    python -m scripts.loadtest --ramp --llm-latency 1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from itertools import combinations
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+ROOT = Path(__file__).parent.parent
+SAMPLES_DIR = ROOT / "samples"
+
+# Stub LLM latency before the first token, in seconds
+STUB_LATENCY_ENV = "STUB_LLM_LATENCY"
+
+
+# --- Stub LLM server -------------------------------------------------------
+
+stub_app = FastAPI(title="WhichBid stub LLM")
+
+
+def _stub_quote(text: str) -> dict:
+    """Fabricate a plausible ParsedQuote from quote text."""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    vendor = lines[0] if lines else "Unknown Vendor"
+    amounts = [
+        float(a.replace(",", ""))
+        for a in re.findall(r"\$\s?(\d[\d,]*(?:\.\d{2})?)", text)
+    ]
+    total = max(amounts, default=1000.0)
+    return {
+        "vendor_name": vendor,
+        "line_items": [
+            {"description": "Stub labor", "category": "labor", "total": round(total * 0.6, 2)},
+            {"description": "Stub materials", "category": "materials", "total": round(total * 0.4, 2)},
+        ],
+        "subtotal": total,
+        "tax": None,
+        "total": total,
+    }
+
+
+def _stub_response(prompt: str) -> dict:
+    """Build a schema-valid response for whichever WhichBid prompt was sent."""
+    if "## Parsed Quotes" in prompt:
+        vendors = re.findall(r'"vendor_name": "((?:[^"\\]|\\.)*)"', prompt)
+        totals = [float(t) for t in re.findall(r'"total": (\d+(?:\.\d+)?),\s*"payment_terms"', prompt)]
+        ranking = [
+            {
+                "vendor": vendor,
+                "base_price": totals[i] if i < len(totals) else 0.0,
+                "true_total": totals[i] if i < len(totals) else 0.0,
+                "score": max(0, 90 - 10 * i),
+                "pros": ["Stub pro"],
+                "cons": ["Stub con"],
+            }
+            for i, vendor in enumerate(vendors)
+        ]
+        return {
+            "normalized_categories": ["labor", "materials"],
+            "hidden_costs": [],
+            "ranking": ranking,
+            "recommendation": f"Choose {vendors[0] if vendors else 'the first vendor'}.",
+            "reasoning": "Stub reasoning.",
+            "confidence": 0.8,
+            "caveats": [],
+        }
+    if "### Document " in prompt:
+        documents = re.split(r"### Document (\d+)\n", prompt.split("never merge documents")[-1])[1:]
+        return {
+            "quotes": [
+                {"document": int(n), **_stub_quote(text)}
+                for n, text in zip(documents[::2], documents[1::2])
+            ]
+        }
+    if "Quote text:" in prompt:
+        return _stub_quote(prompt.split("Quote text:", 1)[1])
+    return {}
+
+
+@stub_app.post("/chat/completions")
+async def stub_chat_completions(request: Request) -> StreamingResponse:
+    """OpenAI-compatible streaming chat completion with configurable latency."""
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    content = json.dumps(_stub_response(prompt))
+    latency = float(os.getenv(STUB_LATENCY_ENV, "0"))
+
+    async def events():
+        await asyncio.sleep(latency)
+        for i in range(0, len(content), 64):
+            chunk = {
+                "id": "stub",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": content[i:i + 64]}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# --- Server processes ------------------------------------------------------
+
+def _start_server(app: str, port: int, env: dict[str, str]) -> subprocess.Popen:
+    """Start a uvicorn server for ``app`` and wait until it accepts requests."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env={**os.environ, **env},
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{app} exited with code {proc.returncode}")
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{app} did not start on port {port}")
+
+
+def read_rss_mb(pid: int) -> float | None:
+    """Resident set size of a process in MB (Linux only)."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+# --- Load generation -------------------------------------------------------
+
+class Results:
+    """Latencies and errors collected during a run."""
+
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.rss: list[tuple[float, float]] = []
+        self.started = time.monotonic()
+        self.finished = self.started
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies) + self.errors
+
+    @property
+    def elapsed(self) -> float:
+        return max(self.finished - self.started, 1e-9)
+
+    def percentile(self, p: float) -> float:
+        """Nearest-rank percentile of successful request latencies."""
+        if not self.latencies:
+            return float("nan")
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def summary(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.errors / self.requests if self.requests else 0.0,
+            "throughput_rps": len(self.latencies) / self.elapsed,
+            "p50_s": self.percentile(50),
+            "p95_s": self.percentile(95),
+            "p99_s": self.percentile(99),
+            "peak_rss_mb": max((mb for _, mb in self.rss), default=None),
+        }
+
+
+def load_packages(min_size: int = 2, max_size: int = 3) -> list[list[tuple[str, bytes]]]:
+    """Build every bid package of sample PDFs within the size range."""
+    samples = [(p.name, p.read_bytes()) for p in sorted(SAMPLES_DIR.glob("*.pdf"))]
+    if len(samples) < min_size:
+        raise RuntimeError(f"Need at least {min_size} sample PDFs in {SAMPLES_DIR}")
+    packages = []
+    for size in range(min_size, min(max_size, len(samples)) + 1):
+        packages.extend(list(combo) for combo in combinations(samples, size))
+    return packages
+
+
+async def _send(client: httpx.AsyncClient, url: str, package, results: Results) -> None:
+    files = [("files", (name, data, "application/pdf")) for name, data in package]
+    start = time.perf_counter()
+    try:
+        response = await client.post(f"{url}/quotes/analyze", files=files)
+        if response.status_code == 200:
+            results.latencies.append(time.perf_counter() - start)
+        else:
+            results.errors += 1
+    except httpx.HTTPError:
+        results.errors += 1
+
+
+async def _sample_rss(pid: int | None, results: Results, interval: float) -> None:
+    if pid is None:
+        return
+    while True:
+        mb = read_rss_mb(pid)
+        if mb is not None:
+            results.rss.append((time.monotonic() - results.started, mb))
+        await asyncio.sleep(interval)
+
+
+async def run_load(
+    url: str,
+    packages: list,
+    duration: float,
+    concurrency: int | None = None,
+    rate: float | None = None,
+    server_pid: int | None = None,
+    timeout: float = 300,
+) -> Results:
+    """
+    Drive load for ``duration`` seconds.
+
+    With ``concurrency``, that many workers send requests back to back
+    (closed loop). With ``rate``, requests start at that many per second
+    regardless of how fast they complete (open loop).
+    """
+    results = Results()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        sampler = asyncio.create_task(_sample_rss(server_pid, results, 1.0))
+        end = time.monotonic() + duration
+
+        if rate:
+            tasks = []
+            next_start = time.monotonic()
+            while next_start < end:
+                await asyncio.sleep(max(0.0, next_start - time.monotonic()))
+                tasks.append(asyncio.create_task(
+                    _send(client, url, random.choice(packages), results)
+                ))
+                next_start += random.expovariate(rate)
+            await asyncio.gather(*tasks)
+        else:
+            async def worker() -> None:
+                while time.monotonic() < end:
+                    await _send(client, url, random.choice(packages), results)
+
+            await asyncio.gather(*(worker() for _ in range(concurrency or 1)))
+
+        results.finished = time.monotonic()
+        sampler.cancel()
+    return results
+
+
+def print_summary(label: str, results: Results) -> None:
+    s = results.summary()
+    rss = f"{s['peak_rss_mb']:.0f} MB" if s["peak_rss_mb"] is not None else "n/a"
+    print(
+        f"{label:>14}  reqs={s['requests']:<5} err={s['error_rate']:6.1%}  "
+        f"rps={s['throughput_rps']:7.2f}  p50={s['p50_s']:6.2f}s  "
+        f"p95={s['p95_s']:6.2f}s  p99={s['p99_s']:6.2f}s  peak_rss={rss}"
+    )
+
+
+async def ramp(url: str, packages: list, step_duration: float, max_concurrency: int, server_pid: int | None) -> None:
+    """
+    Double concurrency each step until throughput stops improving.
+
+    The saturation point is the last step whose throughput grew by at
+    least 10% without errors creeping above 1%.
+    """
+    best: tuple[int, float] | None = None
+    concurrency = 1
+    while concurrency <= max_concurrency:
+        results = await run_load(url, packages, step_duration, concurrency=concurrency, server_pid=server_pid)
+        print_summary(f"c={concurrency}", results)
+        summary = results.summary()
+        if summary["error_rate"] > 0.01:
+            break
+        if best is not None and summary["throughput_rps"] < best[1] * 1.1:
+            break
+        best = (concurrency, summary["throughput_rps"])
+        concurrency *= 2
+
+    if best:
+        print(f"\nSaturation at concurrency ~{best[0]} ({best[1]:.2f} req/s)")
+    else:
+        print("\nErrors at concurrency 1; no saturation point found")
+
+
+def main():
+    """Run the load test."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Target an already-running API instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="PID to sample RSS from when using --url")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the API started locally")
+    parser.add_argument("--stub-port", type=int, default=8766, help="Port for the stub LLM")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Stub LLM latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=4, help="Closed-loop workers")
+    parser.add_argument("--rate", type=float, help="Open-loop target requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run (per step with --ramp)")
+    parser.add_argument("--ramp", action="store_true", help="Find the saturation point by doubling concurrency")
+    parser.add_argument("--max-concurrency", type=int, default=256, help="Upper bound for --ramp")
+    parser.add_argument("--json", action="store_true", help="Print the summary and RSS timeline as JSON")
+    args = parser.parse_args()
+
+    packages = load_packages()
+    processes: list[subprocess.Popen] = []
+    try:
+        url, pid = args.url, args.server_pid
+        if url is None:
+            processes.append(_start_server(
+                "scripts.loadtest:stub_app", args.stub_port,
+                {STUB_LATENCY_ENV: str(args.llm_latency)},
+            ))
+            api = _start_server("main:app", args.port, {
+                "OPENROUTER_BASE_URL": f"http://127.0.0.1:{args.stub_port}",
+                "OPENROUTER_API_KEY": "stub",
+                "LLM_CASSETTE_MODE": "off",
+            })
+            processes.append(api)
+            url, pid = f"http://127.0.0.1:{args.port}", api.pid
+
+        if args.ramp:
+            asyncio.run(ramp(url, packages, args.duration, args.max_concurrency, pid))
+            return
+
+        results = asyncio.run(run_load(
+            url, packages, args.duration,
+            concurrency=None if args.rate else args.concurrency,
+            rate=args.rate, server_pid=pid,
+        ))
+        if args.json:
+            print(json.dumps({**results.summary(), "rss_mb": results.rss}, indent=2))
+        else:
+            label = f"rate={args.rate}" if args.rate else f"c={args.concurrency}"
+            print_summary(label, results)
+    finally:
+        for proc in processes:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
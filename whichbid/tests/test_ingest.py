@@ -0,0 +1,48 @@
+"""Tests for reading spreadsheet rows as quotes."""
+
+from core.ingest import rows_to_quote
+
+
+ROWS = [
+    ["Vendor: Budget Builders"],
+    ["Quote date", "2026-02-01"],
+    [],
+    ["Description", "Qty", "Unit Price", "Total"],
+    ["Drywall installation", 10, "$40.00", "$400.00"],
+    ["Paint supplies", 1, "120", "120"],
+    ["Subtotal", None, None, "520"],
+    ["Tax", "8%", None, "41.60"],
+    ["Total", None, None, "561.60"],
+]
+
+
+def test_reads_metadata_items_and_summary_rows():
+    quote = rows_to_quote(ROWS, "Default Vendor")
+    assert quote.vendor_name == "Budget Builders"
+    assert quote.quote_date == "2026-02-01"
+    assert [(i.description, i.quantity, i.unit_price, i.total) for i in quote.line_items] == [
+        ("Drywall installation", 10, 40, 400),
+        ("Paint supplies", 1, 120, 120),
+    ]
+    assert (quote.subtotal, quote.tax, quote.total) == (520, 41.6, 561.6)
+
+
+def test_infers_categories_without_a_category_column():
+    quote = rows_to_quote(ROWS, "Default Vendor")
+    assert [i.category for i in quote.line_items] == ["labor", "materials"]
+
+
+def test_totals_sheet_without_summary_rows():
+    rows = [
+        ["Item", "Category", "Amount"],
+        ["Permit fee", "permits", 75],
+        ["Framing", "labor", 925],
+    ]
+    quote = rows_to_quote(rows, "Default Vendor")
+    assert quote.vendor_name == "Default Vendor"
+    assert [i.category for i in quote.line_items] == ["permits", "labor"]
+    assert (quote.subtotal, quote.total) == (1000, 1000)
+
+
+def test_no_header_row():
+    assert rows_to_quote([["foo", "bar"], [1, 2]], "Default Vendor") is None
@@ -0,0 +1,44 @@
+"""Tests for page text cleanup."""
+
+from core.preprocess import page_bodies, preprocess_pages
+
+
+TERMS = "\n".join(f"Clause {i} applies to all work" for i in range(6))
+
+PAGES = [
+    "ACME PLUMBING\nQuote Rev 3 - Jan 5 2026\nLabor    $500.00\nSome   notes\nPage 1 of 2",
+    f"ACME PLUMBING\nQuote Rev 3 - Jan 5 2026\nTotal $810.00\nTerms and Conditions\n{TERMS}\n"
+    "Late fee $25.00\nPage 2 of 2",
+]
+
+
+def test_removes_repeated_lines_after_first_page():
+    result = preprocess_pages(PAGES)
+    first, second = result.text.split("\n\n")
+    assert first.startswith("ACME PLUMBING\nQuote Rev 3")
+    assert "ACME PLUMBING" not in second
+    assert "Page 2 of 2" not in second
+    assert result.removed_lines == 3
+    assert 0 < result.reduction < 1
+
+
+def test_collapses_whitespace():
+    assert "Labor $500.00\nSome notes" in preprocess_pages(PAGES).text
+
+
+def test_drop_terms_keeps_amounts():
+    text = preprocess_pages(PAGES, drop_terms=True).text
+    assert "Clause" not in text
+    assert "Terms and Conditions" not in text
+    assert "Late fee $25.00" in text
+
+
+def test_keeps_terms_by_default():
+    assert "Clause 5 applies" in preprocess_pages(PAGES).text
+
+
+def test_page_bodies_ignore_running_headers_and_footers():
+    bodies = page_bodies(PAGES)
+    assert bodies[0] == "Labor $500.00\nSome notes"
+    assert bodies[1].startswith("Total $810.00")
+    assert "Page 2 of 2" not in bodies[1]
@@ -0,0 +1,58 @@
+"""Tests for LLM output repair and coercion."""
+
+import pytest
+
+from core.repair import coerce_confidence, coerce_number, infer_category, load_json
+
+
+def test_load_json_strips_fence_and_trailing_commas():
+    text = '```json\n{"a": [1, 2,], "b": {"c": "x"},}\n```'
+    assert load_json(text) == {"a": [1, 2], "b": {"c": "x"}}
+
+
+def test_load_json_skips_leading_prose():
+    assert load_json('Here is the quote: {"vendor": "Acme"}') == {"vendor": "Acme"}
+
+
+def test_load_json_closes_truncated_document():
+    # The cut-off string may be incomplete, so it is dropped
+    assert load_json('{"a": 1, "b": "trunc') == {"a": 1}
+    assert load_json('{"items": [{"x": 1}, {"x": 2}') == {"items": [{"x": 1}, {"x": 2}]}
+
+
+def test_load_json_rejects_empty_response():
+    with pytest.raises(ValueError):
+        load_json("   ")
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("$1,200.00", 1200.0),
+    ("(50)", -50.0),
+    ("-$3.5", -3.5),
+    (" 42 ", 42.0),
+    (12, 12),
+])
+def test_coerce_number_reads_amounts(value, expected):
+    assert coerce_number(value) == expected
+
+
+@pytest.mark.parametrize("value", ["8%", "10-20", "1,200 and 300", "TBD", True, None])
+def test_coerce_number_leaves_non_amounts(value):
+    assert coerce_number(value) is value
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0.8, 0.8),
+    (1.5, 1.0),
+    (85, 0.85),
+    ("85%", 0.85),
+    (2, 0.02),
+])
+def test_coerce_confidence(value, expected):
+    assert coerce_confidence(value) == pytest.approx(expected)
+
+
+def test_infer_category():
+    assert infer_category("Drywall installation") == "labor"
+    assert infer_category("Paint supplies") == "materials"
+    assert infer_category("Miscellaneous") == "other"
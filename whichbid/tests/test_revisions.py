@@ -0,0 +1,108 @@
+"""Tests for parsing a quote as a revision of a recorded one."""
+
+import json
+
+import pytest
+
+import core.parser
+from core.models import ParsedQuote, QuoteLineItem
+from core.revisions import find_previous, page_hashes, parse_revision, record_revision
+
+
+PAGES = [
+    "ACME PLUMBING\nQuote for kitchen remodel\n"
+    "Pipe fitting labor 10 50.00 $500.00\nCopper pipe 20 12.50 $250.00",
+    "Fixtures and finish\nFaucet install 1 150.00 $150.00\nSubtotal $900.00\nTotal $900.00",
+]
+
+QUOTE = ParsedQuote(
+    vendor_name="Acme Plumbing",
+    line_items=[
+        QuoteLineItem(description="Pipe fitting labor", category="labor", quantity=10, unit_price=50, total=500),
+        QuoteLineItem(description="Copper pipe", category="materials", quantity=20, unit_price=12.5, total=250),
+        QuoteLineItem(description="Faucet install", category="labor", quantity=1, unit_price=150, total=150),
+    ],
+    subtotal=900,
+    total=900,
+)
+
+FAUCETS = {
+    "description": "Faucet install", "category": "labor",
+    "quantity": 2, "unit_price": 150, "total": 300, "page": 2,
+}
+
+
+@pytest.fixture(autouse=True)
+def revision_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("QUOTE_REVISIONS", "on")
+    monkeypatch.setenv("QUOTE_REVISION_DIR", str(tmp_path))
+    record_revision(PAGES, QUOTE)
+    return tmp_path
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Serve a canned page parse, recording the prompts sent."""
+    prompts: list[str] = []
+
+    def serve(response: dict) -> list[str]:
+        def stream_chat(prompt, model=None):
+            prompts.append(prompt)
+            yield json.dumps(response)
+
+        monkeypatch.setattr(core.parser, "stream_chat", stream_chat)
+        return prompts
+
+    return serve
+
+
+def test_unchanged_document_reuses_previous_parse(llm):
+    prompts = llm({})
+    quote, item_pages, report = parse_revision(PAGES)
+    assert quote == QUOTE
+    assert item_pages == [1, 1, 2]
+    assert report.changed_pages == []
+    assert prompts == []
+
+
+def test_only_changed_pages_are_parsed(llm):
+    pages = [PAGES[0], "Fixtures and finish\nFaucet install 2 150.00 $300.00\nSubtotal $1,050.00\nTotal $1,050.00"]
+    prompts = llm({"line_items": [FAUCETS], "subtotal": 1050, "total": 1050})
+    quote, item_pages, report = parse_revision(pages)
+    assert len(prompts) == 1
+    assert "Copper pipe" not in prompts[0]
+    assert quote.total == 1050
+    assert item_pages == [1, 1, 2]
+    assert report.changed_pages == [2]
+    assert [i.total for i in report.removed_items] == [150]
+    assert [i.total for i in report.added_items] == [300]
+
+
+def test_patched_totals_must_match_stated_totals(llm):
+    pages = [PAGES[0], "Fixtures and finish\nFaucet install 2 150.00 $300.00\nSubtotal $1,000.00\nTotal $1,000.00"]
+    llm({"line_items": [FAUCETS], "subtotal": 1000, "total": 1000})
+    assert parse_revision(pages) is None
+
+
+def test_patched_totals_must_match_unchanged_totals_page(llm):
+    # Page 1 changed but the totals page didn't, so the total still holds
+    pages = [PAGES[0].replace("20 12.50 $250.00", "24 12.50 $300.00"), PAGES[1]]
+    llm({"line_items": [
+        {"description": "Pipe fitting labor", "category": "labor", "total": 500, "page": 1},
+        {"description": "Copper pipe", "category": "materials", "total": 300, "page": 1},
+    ]})
+    assert parse_revision(pages) is None
+
+
+def test_previous_revision_must_be_same_vendor(revision_dir):
+    other = QUOTE.model_copy(update={"vendor_name": "Acme"})
+    record_revision(["ACME\nOur quote\nPipe fitting labor 10 50.00 $500.00", PAGES[1]], other, [1, 1, 2])
+    hashes = page_hashes(PAGES)
+    assert find_previous(hashes, PAGES[0]).vendor_name == "Acme Plumbing"
+    # "Acme" is a whole word of "Acme Plumbing" but not of "Acmeco"
+    assert find_previous(hashes, "ACMECO PLUMBING") is None
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setenv("QUOTE_REVISIONS", "off")
+    assert parse_revision(PAGES) is None
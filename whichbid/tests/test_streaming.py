@@ -0,0 +1,58 @@
+"""Tests for the incremental JSON parser."""
+
+import pytest
+
+from core.streaming import IncrementalJSONParser, MalformedJSONError
+
+
+def test_emits_watched_values_as_they_complete():
+    seen = []
+    parser = IncrementalJSONParser(
+        watch={("line_items", "*")}, on_value=lambda path, value: seen.append((path, value))
+    )
+    parser.feed('{"line_items": [{"a"')
+    assert seen == []
+    parser.feed(': 1}, {"a": 2}]')
+    assert seen == [(("line_items", 0), {"a": 1}), (("line_items", 1), {"a": 2})]
+    parser.feed("}")
+    assert parser.complete
+    assert parser.close() == {"line_items": [{"a": 1}, {"a": 2}]}
+
+
+def test_skips_fence_and_surrounding_prose():
+    parser = IncrementalJSONParser()
+    parser.feed_all(['Sure!\n```json\n{"a": [1, 2]}', "\n```\nHope that helps."])
+    assert parser.close() == {"a": [1, 2]}
+
+
+def test_feed_all_stops_once_complete():
+    read = []
+
+    def chunks():
+        for chunk in ['{"a": 1}', " trailing", " remarks"]:
+            read.append(chunk)
+            yield chunk
+
+    parser = IncrementalJSONParser()
+    parser.feed_all(chunks())
+    assert read == ['{"a": 1}']
+    assert parser.close() == {"a": 1}
+
+
+def test_tolerates_trailing_commas():
+    parser = IncrementalJSONParser()
+    parser.feed('{"a": [1, 2,], "b": 3,}')
+    assert parser.close() == {"a": [1, 2], "b": 3}
+
+
+def test_close_repairs_truncated_stream():
+    parser = IncrementalJSONParser()
+    parser.feed('{"a": [{"x": 1}, {"x": 2}, ')
+    assert not parser.complete
+    assert parser.close() == {"a": [{"x": 1}, {"x": 2}]}
+
+
+def test_structural_error_raises_immediately():
+    parser = IncrementalJSONParser()
+    with pytest.raises(MalformedJSONError):
+        parser.feed('{"a": 1 "b"')
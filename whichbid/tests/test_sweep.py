@@ -0,0 +1,74 @@
+"""Tests for local criteria sweeps."""
+
+import pytest
+
+from core.models import ComparisonCriteria, CriteriaGrid, ParsedQuote, QuoteLineItem
+from core.sweep import MAX_VARIANTS, UNKNOWN, QuoteFeatures, expand_grid, sweep_criteria
+
+
+def make_quote(vendor: str, total: float, timeline: str | None = None, category: str = "labor") -> ParsedQuote:
+    return ParsedQuote(
+        vendor_name=vendor,
+        line_items=[QuoteLineItem(description="Work", category=category, total=total)],
+        subtotal=total,
+        total=total,
+        timeline=timeline,
+    )
+
+
+QUOTES = [
+    make_quote("Cheap Co", 1000, timeline="6 weeks"),
+    make_quote("Fast Co", 3000, timeline="2 weeks"),
+]
+
+
+def test_expand_grid_puts_base_first_and_drops_duplicates():
+    base = ComparisonCriteria(priorities=["price", "timeline"])
+    grid = CriteriaGrid(permute_priorities=True, budget_limit=[None, 1200])
+    variants = expand_grid(base, grid)
+    assert variants[0] == base
+    # The base reappears as a combination and is dropped
+    assert len(variants) == 4
+    assert len({v.model_dump_json() for v in variants}) == 4
+
+
+def test_expand_grid_rejects_oversized_grids():
+    base = ComparisonCriteria(priorities=[f"p{i}" for i in range(8)])
+    with pytest.raises(ValueError, match=str(MAX_VARIANTS)):
+        expand_grid(base, CriteriaGrid(permute_priorities=True))
+
+
+def test_sweep_finds_winner_flips():
+    base = ComparisonCriteria(priorities=["price", "timeline"])
+    variants = expand_grid(base, CriteriaGrid(priorities=[["timeline", "price"]]))
+    result = sweep_criteria(QUOTES, variants)
+    assert [v.winner for v in result.variants] == ["Cheap Co", "Fast Co"]
+    assert result.stability == 0.5
+    assert [f.variant for f in result.flips] == [1]
+
+
+def test_sweep_applies_budget_penalty():
+    base = ComparisonCriteria(priorities=["timeline", "price"])
+    variants = expand_grid(base, CriteriaGrid(budget_limit=[1200]))
+    result = sweep_criteria(QUOTES, variants)
+    assert result.variants[0].winner == "Fast Co"
+    assert result.variants[1].winner == "Cheap Co"
+
+
+def test_sweep_reports_unscored_priorities():
+    result = sweep_criteria(QUOTES, [ComparisonCriteria(priorities=["price", "vibes"])])
+    assert result.unscored_priorities == ["vibes"]
+
+
+def test_uncategorised_quote_price_is_unknown():
+    quotes = [make_quote("Known", 1000), make_quote("Unknown", 900, category="other")]
+    features = QuoteFeatures(quotes)
+    assert features.columns["price"][1] == UNKNOWN
+    assert features.columns["scope"][1] == UNKNOWN
+
+
+def test_sweep_requires_quotes_and_variants():
+    with pytest.raises(ValueError):
+        sweep_criteria([], [ComparisonCriteria()])
+    with pytest.raises(ValueError):
+        sweep_criteria(QUOTES, [])
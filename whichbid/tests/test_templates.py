@@ -0,0 +1,92 @@
+"""Tests for learning and applying vendor templates."""
+
+import pytest
+
+from core.models import ParsedQuote, QuoteLineItem
+from core.templates import learn_template, load_templates, parse_with_templates
+
+
+TEXT = """ACME PLUMBING
+123 Main St
+Quote Date: March 3, 2026
+Description Qty Unit Price Total
+Pipe fitting labor 10 50.00 500.00
+Copper pipe 20 12.50 250.00
+Subtotal: $750.00
+Tax (8%): $60.00
+Total: $810.00
+Payment Terms: Net 30"""
+
+QUOTE = ParsedQuote(
+    vendor_name="Acme Plumbing",
+    quote_date="2026-03-03",
+    line_items=[
+        QuoteLineItem(description="Pipe fitting labor", category="labor", quantity=10, unit_price=50, total=500),
+        QuoteLineItem(description="Copper pipe", category="materials", quantity=20, unit_price=12.5, total=250),
+    ],
+    subtotal=750,
+    tax=60,
+    total=810,
+    payment_terms="Net 30",
+)
+
+# The next quote from the same vendor: new quantities, totals and date
+NEXT_TEXT = (
+    TEXT.replace("10 50.00 500.00", "12 50.00 600.00")
+    .replace("$750.00", "$850.00")
+    .replace("$60.00", "$68.00")
+    .replace("$810.00", "$918.00")
+    .replace("March 3", "April 9")
+)
+
+
+@pytest.fixture(autouse=True)
+def template_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("VENDOR_TEMPLATES", "on")
+    monkeypatch.setenv("VENDOR_TEMPLATE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_learned_template_reproduces_its_parse():
+    assert learn_template(TEXT, QUOTE) is not None
+    assert parse_with_templates(TEXT) == QUOTE
+
+
+def test_learned_template_reads_next_quote():
+    learn_template(TEXT, QUOTE)
+    quote = parse_with_templates(NEXT_TEXT)
+    assert quote.quote_date == "2026-04-09"
+    assert [(i.quantity, i.total, i.category) for i in quote.line_items] == [
+        (12, 600, "labor"),
+        (20, 250, "materials"),
+    ]
+    assert (quote.subtotal, quote.tax, quote.total) == (850, 68, 918)
+
+
+def test_template_refuses_totals_that_dont_add_up():
+    learn_template(TEXT, QUOTE)
+    assert parse_with_templates(NEXT_TEXT.replace("$918.00", "$999.00")) is None
+
+
+def test_inconsistent_parse_is_not_learned(template_dir):
+    wrong = QUOTE.model_copy(update={"total": 900})
+    assert learn_template(TEXT, wrong) is None
+    assert list(template_dir.iterdir()) == []
+
+
+def test_other_vendor_is_not_matched():
+    learn_template(TEXT, QUOTE)
+    assert parse_with_templates(TEXT.replace("ACME PLUMBING", "ACME PLUMBING SUPPLY")) is None
+
+
+def test_corrupt_template_file_is_ignored(template_dir):
+    (template_dir / "acme_plumbing.json").write_text("[{broken")
+    assert load_templates() == []
+    assert learn_template(TEXT, QUOTE) is not None
+    assert len(load_templates()) == 1
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setenv("VENDOR_TEMPLATES", "off")
+    assert learn_template(TEXT, QUOTE) is None
+    assert parse_with_templates(TEXT) is None